@@ -28,6 +28,7 @@ IMPORT_CHECKS = {
     "PyInstaller": "pyinstaller",
     "pandas": "pandas",
     "openpyxl": "openpyxl",
+    "xlsxwriter": "xlsxwriter",
     "requests": "requests",
     "numpy": "numpy",
     "folium": "folium",
@@ -141,6 +142,7 @@ for package in [
     "pandas",
     "numpy",
     "openpyxl",
+    "xlsxwriter",
     "folium",
     "branca",
     "jinja2",
@@ -167,6 +169,7 @@ explicit_hiddenimports = [
     "output_handler",
     "osrm_client",
     "valhalla_client",
+    "numba_helpers",
     "run_main",
 
     # OR-Tools modules used by the solver.
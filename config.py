@@ -246,8 +246,18 @@ class ValhallaConfig:
     timeout_seconds: int = 60  # Максимално време за изчакване
     retry_attempts: int = 3  # Брой опити при неуспешна заявка
     retry_delay_seconds: int = 1  # Време за изчакване между опитите
+    max_concurrent_requests: int = 32  # Максимален брой паралелни batch заявки (и размер на HTTP connection pool-а)
+    use_http2: bool = True  # Използва httpx с HTTP/2 (multiplexing), ако httpx и h2 са инсталирани; иначе requests
+    use_async_requests: bool = True  # Batch заявките през asyncio + aiohttp (ако е инсталиран); иначе ThreadPoolExecutor
+    exploit_symmetry: bool = True  # Без time-dependent routing: заявява само горния триъгълник от batch блокове и огледално копира долния
+    matrix_row_strips: bool = True  # Batch режим: една заявка за batch източника към всички цели (вместо 50x50 блокове); при отказ от сървъра - автоматично към блокове
+    deduplicate_locations: bool = True  # Повтарящите се координати се изпращат към Valhalla веднъж, а матрицата се разгъва след това
+    dedup_decimals: int = 5  # Точност (знаци след десетичната точка) при сравняване на координати за дубликати (5 ≈ 1 м)
     use_cache: bool = False  # Дали да се кешират резултатите
     cache_expiry_hours: int = 24  # Време за валидност на кеша
+    incremental_cache: bool = True  # При промяна на локациите: преизползва най-близката кеширана матрица и изисква само новите редове/колони
+    incremental_cache_candidates: int = 5  # Колко от най-новите кеширани матрици да се проверят за общи локации
+    incremental_cache_min_overlap: float = 0.5  # Минимален дял познати локации за частичен кеш - при по-малко пълната batch заявка е по-бърза
     
     # Time-dependent routing настройки
     date_time_type: int = 1  # 0=current, 1=depart_at, 2=arrive_by
@@ -431,12 +441,17 @@ class OutputConfig:
     map_zoom_level: int = 12 # Начално приближение на картата.
     show_route_colors: bool = True # Дали различните маршрути да се оцветяват в различни цветове.
     show_vehicle_info: bool = True # Дали да се показва информация за превозното средство при клик на маршрут.
+    straight_segment_threshold_m: float = 100.0 # Под това разстояние (м) между две точки се чертае права линия без заявка към routing engine.
+    compress_map_output: bool = False # Дали картите да се записват допълнително и като gzip (.html.gz) за по-бърз трансфер.
+    cache_rendered_map: bool = False # Дали рендерираната обща карта да се кешира до map_output_file (<име>.<хеш>.html) и да се преизползва при същото решение.
     
     # Excel файлове
     excel_output_dir: str = _abs_path("C:\\Programming\\Bizant 2.0\\cvrp-ortools-optimizer\\output/excel") # Директория за запис на Excel отчетите.
     warehouse_excel_file: str = "warehouse_orders.xlsx" # Име на файла с необслужените клиенти (за склада).
     routes_excel_file: str = "vehicle_routes.xlsx" # Име на файла с детайли за всеки маршрут.
     efficiency_excel_file: str = "efficiency_report.xlsx" # Име на файла с отчет за ефективността.
+    excel_engine: str = "xlsxwriter" # Библиотека за запис на общия Excel отчет: "xlsxwriter" (по-бърз, ограничена памет), "pyexcelerate" (най-бърз, опционален), "xml" (директен XML запис без библиотека) или "openpyxl".
+    minutes_per_km: float = 2.0 # Приблизително време за пътуване (мин/км) при изчисляване на времената в отчетите.
     
     # CSV файл с маршрути
     csv_output_file: str = _abs_path("C:\\Programming\\Bizant 2.0\\cvrp-ortools-optimizer\\output/routes.csv") # Път и име на CSV файла с маршрутите.
@@ -9,6 +9,7 @@ import time
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
 import logging
+import numpy as np
  
 
 # OR-Tools импорти
@@ -32,16 +33,15 @@ from config import (
 from input_handler import Customer
 from osrm_client import DistanceMatrix
 from warehouse_manager import WarehouseAllocation
+from numba_helpers import njit, prange, NUMBA_AVAILABLE
 
 logger = logging.getLogger(__name__)
 
-def calculate_distance_km(coord1: Optional[Tuple[float, float]], coord2: Tuple[float, float]) -> float:
-    """Изчислява разстоянието между две GPS координати в километри"""
-    if not coord1 or not coord2:
-        return float('inf')
-    
-    lat1, lon1 = math.radians(coord1[0]), math.radians(coord1[1])
-    lat2, lon2 = math.radians(coord2[0]), math.radians(coord2[1])
+@njit(cache=True)
+def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine разстояние в км между две точки в градуси (JIT компилирано, ако има Numba)"""
+    lat1, lon1 = math.radians(lat1), math.radians(lon1)
+    lat2, lon2 = math.radians(lat2), math.radians(lon2)
     
     dlat = lat2 - lat1
     dlon = lon2 - lon1
@@ -52,6 +52,37 @@ def calculate_distance_km(coord1: Optional[Tuple[float, float]], coord2: Tuple[f
     return 6371 * c  # 6371 km е радиусът на Земята
 
 
+@njit(cache=True, parallel=True)
+def _haversine_km_batch_nb(lats: np.ndarray, lons: np.ndarray, lat: float, lon: float) -> np.ndarray:
+    """Разстояния в км от масив точки до една точка - паралелно по точките"""
+    result = np.empty(lats.shape[0], dtype=np.float64)
+    for i in prange(lats.shape[0]):
+        result[i] = _haversine_km(lats[i], lons[i], lat, lon)
+    return result
+
+
+def haversine_km_batch(lats: np.ndarray, lons: np.ndarray, lat: float, lon: float) -> np.ndarray:
+    """Изчислява разстоянията в км от масиви с ширини/дължини до точката (lat, lon)"""
+    lats = np.ascontiguousarray(lats, dtype=np.float64)
+    lons = np.ascontiguousarray(lons, dtype=np.float64)
+    if NUMBA_AVAILABLE:
+        return _haversine_km_batch_nb(lats, lons, float(lat), float(lon))
+    
+    # Без Numba - същата формула, векторизирана с NumPy
+    lat1, lon1 = np.radians(lats), np.radians(lons)
+    lat2, lon2 = math.radians(lat), math.radians(lon)
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1) * math.cos(lat2) * np.sin((lon2 - lon1)/2)**2
+    return 6371 * 2 * np.arcsin(np.sqrt(a))
+
+
+def calculate_distance_km(coord1: Optional[Tuple[float, float]], coord2: Tuple[float, float]) -> float:
+    """Изчислява разстоянието между две GPS координати в километри"""
+    if not coord1 or not coord2:
+        return float('inf')
+    
+    return _haversine_km(float(coord1[0]), float(coord1[1]), float(coord2[0]), float(coord2[1]))
+
+
  
 
 
@@ -142,7 +173,8 @@ class ORToolsSolver:
         self.config = config
         self.vehicle_configs = vehicle_configs
         self.customers = customers
-        self.distance_matrix = distance_matrix
+        # OR-Tools callback-ите четат клетка по клетка - list-of-lists е най-бързо
+        self.distance_matrix = distance_matrix.as_lists()
         self.unique_depots = unique_depots
         self.center_zone_customers = center_zone_customers or []
         self.location_config = location_config
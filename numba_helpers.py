@@ -0,0 +1,32 @@
+"""
+Общи помощни средства за Numba JIT компилация
+Numba е опционална зависимост - без нея декораторите връщат функцията непроменена
+"""
+
+try:
+    from numba import njit, prange, vectorize
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """Заместител на numba.njit, който връща функцията без компилация"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
+
+    def vectorize(*args, **kwargs):
+        """
+        Заместител на numba.vectorize, който връща функцията без компилация.
+        Функциите трябва да са написани с NumPy ufunc-ове, за да работят и върху масиви.
+        """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
@@ -9,8 +9,9 @@ import time
 import hashlib
 import os
 from typing import List, Dict, Tuple, Optional, Union
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import logging
+import numpy as np
 
 from datetime import datetime, timedelta
 from config import get_config, OSRMConfig
@@ -22,12 +23,34 @@ logger = logging.getLogger(__name__)
 
 @dataclass
 class DistanceMatrix:
-    """Клас за матрица с разстояния и времена"""
-    distances: List[List[float]]  # в метри
-    durations: List[List[float]]  # в секунди
+    """Клас за матрица с разстояния и времена (np.ndarray или list of lists)"""
+    distances: Union[np.ndarray, List[List[float]]]  # в метри
+    durations: Union[np.ndarray, List[List[float]]]  # в секунди
     locations: List[Tuple[float, float]]  # координати
     sources: List[int]  # индекси на източниците
     destinations: List[int]  # индекси на дестинациите
+    
+    def distance(self, i: int, j: int) -> int:
+        """Разстояние от i до j в метри (цяло число)"""
+        return int(self.distances[i][j])
+    
+    def duration(self, i: int, j: int) -> int:
+        """Време от i до j в секунди (цяло число)"""
+        return int(self.durations[i][j])
+    
+    def as_lists(self) -> 'DistanceMatrix':
+        """
+        Връща матрицата с list-of-lists стойности.
+        Нужно за OR-Tools callback-ите, които четат по една клетка - там
+        индексирането на list е по-бързо от това на np.ndarray.
+        """
+        if isinstance(self.distances, np.ndarray) or isinstance(self.durations, np.ndarray):
+            return replace(
+                self,
+                distances=np.asarray(self.distances).tolist(),
+                durations=np.asarray(self.durations).tolist()
+            )
+        return self
 
 
 @dataclass
@@ -5,20 +5,36 @@
 
 import folium
 from branca.element import MacroElement, Template
+import numpy as np
 import pandas as pd
 import requests
+import csv
 import json
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import gzip
+import hashlib
 import html
+import itertools
 import math
-from typing import List, Dict, Tuple, Optional
+from math import radians, sin, cos, sqrt, atan2
+import zipfile
+from xml.sax.saxutils import escape as xml_escape, quoteattr as xml_quoteattr
+from dataclasses import dataclass, field
+from typing import Iterator, List, Dict, Tuple, Optional
 import os
+import re
 import logging
+import shutil
+import weakref
 from datetime import datetime
 from config import get_config, OutputConfig, RoutingEngine, is_location_in_center_zone
 from cvrp_solver import CVRPSolution, Route
 from warehouse_manager import WarehouseAllocation
 from input_handler import Customer
 from osrm_client import get_distance_matrix_from_central_cache
+from numba_helpers import njit, prange, NUMBA_AVAILABLE
 
 try:
     from folium.plugins import PolyLineTextPath
@@ -26,7 +42,28 @@ except ImportError:
     PolyLineTextPath = None
 
 # OpenPyXL imports за Excel стилове
+from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
+try:
+    import pyexcelerate
+    PYEXCELERATE_AVAILABLE = True
+except ImportError:
+    PYEXCELERATE_AVAILABLE = False
 
 try:
     import matplotlib
@@ -62,6 +99,152 @@ def _append_run_date_to_filename(file_path: str, run_date: Optional[str] = None)
         return file_path
     return os.path.join(directory, f"{stem}_{date_stamp}{extension}")
 
+def _post_json(url: str, payload: Dict, timeout: float) -> requests.Response:
+    """POST заявка с JSON тяло - сериализира с orjson, ако е наличен"""
+    if ORJSON_AVAILABLE:
+        return requests.post(
+            url,
+            data=orjson.dumps(payload),
+            headers={'Content-Type': 'application/json'},
+            timeout=timeout,
+        )
+    return requests.post(url, json=payload, timeout=timeout)
+
+
+def _response_json(response: requests.Response):
+    """Парсва JSON отговор - с orjson, ако е наличен"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+@njit(cache=True)
+def _haversine_m(lat1, lon1, lat2, lon2):
+    """Разстояние по дъга между две точки в метри"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 6371000 * 2 * math.asin(math.sqrt(a))
+
+
+def _haversine_km_array(points1: np.ndarray, points2: np.ndarray) -> np.ndarray:
+    """Векторизиран Haversine в км между масиви от точки (N, 2) в градуси.
+    Редове с липсваща точка (NaN) получават разстояние 0.
+    """
+    p1 = np.deg2rad(points1)
+    p2 = np.deg2rad(points2)
+    dlat = p2[:, 0] - p1[:, 0]
+    dlon = p2[:, 1] - p1[:, 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(p1[:, 0]) * np.cos(p2[:, 0]) * np.sin(dlon / 2) ** 2
+    distances = 2 * 6371 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return np.nan_to_num(distances, nan=0.0)
+
+
+@njit(cache=True)
+def _compute_route_metrics(coords_rad, depot_rad, service_time, minutes_per_km, start_time):
+    """Метрики по спирки на един маршрут (координати в радиани, NaN за липсващи).
+    Връща масиви: разстояние от предишната спирка, натрупано разстояние, време за стъпката
+    (път + обслужване), натрупано време и време със стартовото време.
+    """
+    n = coords_rad.shape[0]
+    dist_prev = np.zeros(n)
+    cum_dist = np.zeros(n)
+    time_step = np.zeros(n)
+    cum_time = np.zeros(n)
+    time_with_start = np.zeros(n)
+
+    prev_lat = depot_rad[0]
+    prev_lon = depot_rad[1]
+    total_distance = 0.0
+    total_time = 0.0
+    for k in range(n):
+        lat = coords_rad[k, 0]
+        lon = coords_rad[k, 1]
+        distance = 0.0
+        if not (np.isnan(lat) or np.isnan(prev_lat)):
+            dlat = lat - prev_lat
+            dlon = lon - prev_lon
+            a = math.sin(dlat / 2) ** 2 + math.cos(prev_lat) * math.cos(lat) * math.sin(dlon / 2) ** 2
+            distance = 2 * 6371 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        total_distance += distance
+        step = distance * minutes_per_km + service_time
+        total_time += step
+
+        dist_prev[k] = distance
+        cum_dist[k] = total_distance
+        time_step[k] = step
+        cum_time[k] = total_time
+        time_with_start[k] = start_time + total_time
+
+        prev_lat = lat
+        prev_lon = lon
+
+    return dist_prev, cum_dist, time_step, cum_time, time_with_start
+
+
+@njit(cache=True)
+def _decode_polyline_nb(data, inv):
+    """Декодира encoded polyline (масив от ASCII байтове) в масив (N, 2)"""
+    n = data.shape[0]
+    out = np.empty((n // 2 + 1, 2), dtype=np.float64)
+    count = 0
+    i = 0
+    lat = 0
+    lon = 0
+    while i < n:
+        for j in range(2):
+            shift = 0
+            result = 0
+            byte = 0x20
+            while byte >= 0x20 and i < n:
+                byte = np.int64(data[i]) - 63
+                i += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if j == 0:
+                lat += delta
+            else:
+                lon += delta
+        out[count, 0] = lat * inv
+        out[count, 1] = lon * inv
+        count += 1
+    return out[:count]
+
+
+@njit(cache=True, parallel=True)
+def _assemble_geom(flat, seg_offsets, swap_xy):
+    """Слепва сегменти от точки в една геометрия с едно минаване през паметта.
+
+    flat съдържа всички точки като двойки стойности, seg_offsets са индексите
+    (в точки) на началото на всеки сегмент. Първата точка на всеки следващ
+    сегмент се пропуска, защото съвпада с последната точка на предишния.
+    """
+    num_segments = seg_offsets.shape[0] - 1
+    out_starts = np.empty(num_segments, dtype=np.int64)
+    skips = np.zeros(num_segments, dtype=np.int64)
+    total = 0
+    for s in range(num_segments):
+        seg_len = seg_offsets[s + 1] - seg_offsets[s]
+        if total > 0 and seg_len > 0:
+            skips[s] = 1
+        out_starts[s] = total
+        total += seg_len - skips[s]
+
+    out = np.empty((total, 2), dtype=np.float64)
+    x_idx = 1 if swap_xy else 0
+    y_idx = 0 if swap_xy else 1
+    for s in prange(num_segments):
+        first = seg_offsets[s] + skips[s]
+        for k in range(seg_offsets[s + 1] - first):
+            src = 2 * (first + k)
+            out[out_starts[s] + k, 0] = flat[src + x_idx]
+            out[out_starts[s] + k, 1] = flat[src + y_idx]
+    return out
+
+
 # Настройки за различните типове превозни средства
 VEHICLE_SETTINGS = {
     'internal_bus': {
@@ -90,6 +273,14 @@ VEHICLE_SETTINGS = {
     }
 }
 
+# Настройки за тип превозно средство, който липсва във VEHICLE_SETTINGS
+_DEFAULT_VEHICLE_SETTINGS = {
+    'color': 'gray',
+    'icon': 'circle',
+    'prefix': 'fa',
+    'name': 'Неизвестен'
+}
+
 # Цветове за всеки отделен автобус
 BUS_COLORS = [
     '#FF0000',  # Червен
@@ -299,6 +490,10 @@ class InteractiveMapGenerator:
         self.central_matrix = get_distance_matrix_from_central_cache([])
         self.use_routing = False
         self.routing_engine = None
+        # Кеш в паметта за геометрии на сегменти (валиден в рамките на една карта)
+        self._geom_memo: Dict[Tuple, List[Tuple[float, float]]] = {}
+        # Рендериран HTML по обект на карта - повторен запис не рендерира отново
+        self._rendered_html: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
         
         # Определяме кой routing engine да използваме
         main_config = get_config()
@@ -365,6 +560,7 @@ class InteractiveMapGenerator:
                 zoom_start=self.config.map_zoom_level,
                 tiles=None,
                 control_scale=True,
+                prefer_canvas=True,
             )
             folium.TileLayer(
                 tiles=provider["url"],
@@ -379,15 +575,16 @@ class InteractiveMapGenerator:
             zoom_start=self.config.map_zoom_level,
             tiles=tiles,
             control_scale=True,
+            prefer_canvas=True,
         )
 
     def _segment_distance_m(self, start: Tuple[float, float], end: Tuple[float, float]) -> float:
-        lat1, lon1 = math.radians(start[0]), math.radians(start[1])
-        lat2, lon2 = math.radians(end[0]), math.radians(end[1])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
-        return 6371000 * 2 * math.asin(math.sqrt(a))
+        return _haversine_m(float(start[0]), float(start[1]), float(end[0]), float(end[1]))
+
+    def _is_short_segment(self, start: Tuple[float, float], end: Tuple[float, float]) -> bool:
+        """Дали сегментът е достатъчно къс, за да се начертае като права линия"""
+        threshold_m = getattr(self.config, "straight_segment_threshold_m", 100.0)
+        return self._segment_distance_m(start, end) < threshold_m
 
     def _bearing_degrees(self, start: Tuple[float, float], end: Tuple[float, float]) -> float:
         lat1, lon1 = math.radians(start[0]), math.radians(start[1])
@@ -547,12 +744,7 @@ class InteractiveMapGenerator:
         google_routes = []
         for route_idx, route in enumerate(routes):
             route_number = start_number + route_idx
-            vehicle_settings = VEHICLE_SETTINGS.get(route.vehicle_type.value, {
-                "color": "gray",
-                "icon": "circle",
-                "prefix": "fa",
-                "name": "Неизвестен",
-            })
+            vehicle_settings = VEHICLE_SETTINGS.get(route.vehicle_type.value, _DEFAULT_VEHICLE_SETTINGS)
             bus_color = BUS_COLORS[(route_number - 1) % len(BUS_COLORS)]
             geometry, dashed, geometry_label = self._get_route_visual_geometry(route)
 
@@ -1024,6 +1216,7 @@ class InteractiveMapGenerator:
                   depot_location: Tuple[float, float]) -> folium.Map:
         """Създава интерактивна карта с маршрутите"""
         logger.info("Създавам интерактивна карта")
+        self._geom_memo.clear()
         
         # Показваме routing статуса
         if self.use_routing:
@@ -1055,7 +1248,6 @@ class InteractiveMapGenerator:
         self._add_depot_markers(route_map, list(unique_depots))
         
         # Добавяне на център зоната
-        from config import get_config
         locations = get_config().locations
         if locations.enable_center_zone_priority:
             self._add_center_zone_shape(route_map, locations)
@@ -1071,7 +1263,6 @@ class InteractiveMapGenerator:
     
     def _add_depot_markers(self, route_map: folium.Map, depot_locations: List[Tuple[float, float]]):
         """Добавя маркери за всички депа"""
-        from config import get_config
         locations = get_config().locations
         
         for i, depot in enumerate(depot_locations):
@@ -1094,16 +1285,41 @@ class InteractiveMapGenerator:
         """Добавя маркер за едно депо (поддържа се за обратна съвместимост)"""
         self._add_depot_markers(route_map, [depot_location])
     
+    def _circle_polygon(self, center: Tuple[float, float], radius_km: float,
+                        num_points: int = 64) -> List[List[float]]:
+        """Връща затворен GeoJSON пръстен ([lon, lat]) около центъра с даден радиус"""
+        lat0, lon0 = np.radians(center[0]), np.radians(center[1])
+        angular = radius_km / 6371.0
+        bearings = np.linspace(0.0, 2 * np.pi, num_points, endpoint=False)
+
+        lat = np.arcsin(np.sin(lat0) * np.cos(angular)
+                        + np.cos(lat0) * np.sin(angular) * np.cos(bearings))
+        lon = lon0 + np.arctan2(np.sin(bearings) * np.sin(angular) * np.cos(lat0),
+                                np.cos(angular) - np.sin(lat0) * np.sin(lat))
+
+        ring = np.column_stack((np.degrees(lon), np.degrees(lat)))
+        return np.vstack((ring, ring[:1])).tolist()
+
     def _add_center_zone_circle(self, route_map: folium.Map, center_location: Tuple[float, float], radius_km: float):
         """Добавя кръг за център зоната"""
-        folium.Circle(
-            location=center_location,
-            radius=radius_km * 1000,  # Конвертираме в метри
-            color='red',
-            fill=True,
-            fillColor='red',
-            fillOpacity=0.1,
-            popup=f"<b>Център зона</b><br>Радиус: {radius_km} км",
+        # Кръгът се изчислява веднъж като полигон, вместо Leaflet да го
+        # преизчислява при всяко приближаване/местене на картата
+        zone_feature = {
+            'type': 'Feature',
+            'properties': {},
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [self._circle_polygon(center_location, radius_km)],
+            },
+        }
+        folium.GeoJson(
+            zone_feature,
+            style_function=lambda _: {
+                'color': 'red',
+                'fillColor': 'red',
+                'fillOpacity': 0.1,
+            },
+            popup=folium.Popup(f"<b>Център зона</b><br>Радиус: {radius_km} км"),
             tooltip="Център зона"
         ).add_to(route_map)
         
@@ -1141,9 +1357,10 @@ class InteractiveMapGenerator:
     def _get_osrm_route_geometry(self, start_coords: Tuple[float, float],
                                 end_coords: Tuple[float, float]) -> List[Tuple[float, float]]:
         """Получава реална геометрия на маршрута от OSRM Route API"""
+        if self._is_short_segment(start_coords, end_coords):
+            return [start_coords, end_coords]
+
         try:
-            import requests
-            from config import get_config
             
             # OSRM Route API заявка за пълна геометрия
             osrm_config = get_config().osrm
@@ -1165,7 +1382,7 @@ class InteractiveMapGenerator:
                 coordinates = route['geometry']['coordinates']
                 
                 # Конвертираме от [lon,lat] към [lat,lon] за Folium
-                geometry = [(coord[1], coord[0]) for coord in coordinates]
+                geometry = self._assemble_geometry([coordinates], swap_xy=True)
                 
                 logger.debug(f"✅ OSRM геометрия получена: {len(geometry)} точки")
                 return geometry
@@ -1181,10 +1398,10 @@ class InteractiveMapGenerator:
     def _get_valhalla_route_geometry(self, start_coords: Tuple[float, float],
                                      end_coords: Tuple[float, float]) -> List[Tuple[float, float]]:
         """Получава реална геометрия на маршрута от Valhalla Route API"""
+        if self._is_short_segment(start_coords, end_coords):
+            return [start_coords, end_coords]
+
         try:
-            import requests
-            import json
-            from config import get_config
             
             valhalla_config = get_config().valhalla
             base_url = valhalla_config.base_url.rstrip('/')
@@ -1202,10 +1419,10 @@ class InteractiveMapGenerator:
             }
             
             route_url = f"{base_url}/route"
-            response = requests.post(route_url, json=route_request, timeout=10)
+            response = _post_json(route_url, route_request, timeout=10)
             response.raise_for_status()
             
-            data = response.json()
+            data = _response_json(response)
             
             if 'trip' in data and 'legs' in data['trip']:
                 geometry = []
@@ -1226,8 +1443,37 @@ class InteractiveMapGenerator:
             logger.warning(f"Грешка при Valhalla Route API заявка: {e}")
             return [start_coords, end_coords]
     
+    def _decode_polyline_array(self, encoded: str, precision: int = 6) -> np.ndarray:
+        """Декодира encoded polyline в NumPy масив (N, 2) чрез Numba kernel"""
+        data = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8)
+        return _decode_polyline_nb(data, 1.0 / (10 ** precision))
+
+    def _assemble_geometry(self, segments, swap_xy: bool = False) -> List[Tuple[float, float]]:
+        """Слепва сегменти от точки в една геометрия без дублиране на общите точки.
+
+        При swap_xy=True точките се обръщат от (lon, lat) към (lat, lon).
+        """
+        if NUMBA_AVAILABLE:
+            arrays = [np.asarray(segment, dtype=np.float64).reshape(-1, 2) for segment in segments]
+            seg_offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+            seg_offsets[1:] = np.cumsum([len(points) for points in arrays])
+            flat = np.concatenate(arrays).ravel() if arrays else np.empty(0, dtype=np.float64)
+            return list(map(tuple, _assemble_geom(flat, seg_offsets, swap_xy).tolist()))
+
+        geometry = []
+        for segment in segments:
+            points = [(point[1], point[0]) for point in segment] if swap_xy else list(segment)
+            if geometry:
+                # Премахваме първата точка, за да няма дублиране
+                points = points[1:]
+            geometry.extend(points)
+        return geometry
+
     def _decode_polyline(self, encoded: str, precision: int = 6) -> List[Tuple[float, float]]:
         """Декодира Google encoded polyline (използва се от Valhalla)"""
+        if NUMBA_AVAILABLE:
+            return list(map(tuple, self._decode_polyline_array(encoded, precision).tolist()))
+
         inv = 1.0 / (10 ** precision)
         decoded = []
         previous = [0, 0]
@@ -1255,10 +1501,21 @@ class InteractiveMapGenerator:
     def _get_route_geometry(self, start_coords: Tuple[float, float],
                            end_coords: Tuple[float, float]) -> List[Tuple[float, float]]:
         """Получава геометрия на маршрута от избрания routing engine"""
+        # Еднаквите сегменти (напр. депо -> първи клиент) се заявяват само веднъж
+        key = (round(start_coords[0], 6), round(start_coords[1], 6),
+               round(end_coords[0], 6), round(end_coords[1], 6),
+               self.routing_engine.value if self.routing_engine else None)
+        cached = self._geom_memo.get(key)
+        if cached is not None:
+            return list(cached)
+
         if self.routing_engine and self.routing_engine.value == RoutingEngine.VALHALLA.value:
-            return self._get_valhalla_route_geometry(start_coords, end_coords)
+            geometry = self._get_valhalla_route_geometry(start_coords, end_coords)
         else:
-            return self._get_osrm_route_geometry(start_coords, end_coords)
+            geometry = self._get_osrm_route_geometry(start_coords, end_coords)
+
+        self._geom_memo[key] = list(geometry)
+        return geometry
     
     def _get_full_route_geometry(self, waypoints: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
         """Получава пълната геометрия за маршрут с множество точки.
@@ -1273,15 +1530,12 @@ class InteractiveMapGenerator:
         if len(waypoints) > MAX_WAYPOINTS_FOR_FULL_GEOMETRY:
             logger.info(f"🌀 Маршрутът има {len(waypoints)} точки (> {MAX_WAYPOINTS_FOR_FULL_GEOMETRY}). "
                         f"Използвам опростена геометрия (сегменти) за по-бърза работа.")
-            full_geometry = []
-            for i in range(len(waypoints) - 1):
-                # За всеки сегмент взимаме геометрията (или права линия при грешка)
-                segment_geometry = self._get_route_geometry(waypoints[i], waypoints[i+1])
-                if i > 0:
-                    # Премахваме първата точка, за да няма дублиране
-                    segment_geometry = segment_geometry[1:]
-                full_geometry.extend(segment_geometry)
-            return full_geometry
+            # За всеки сегмент взимаме геометрията (или права линия при грешка)
+            segments = [
+                self._get_route_geometry(waypoints[i], waypoints[i + 1])
+                for i in range(len(waypoints) - 1)
+            ]
+            return self._assemble_geometry(segments)
 
         # Използваме подходящия routing engine
         if self.routing_engine and self.routing_engine.value == RoutingEngine.VALHALLA.value:
@@ -1292,9 +1546,6 @@ class InteractiveMapGenerator:
     def _get_full_route_geometry_valhalla(self, waypoints: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
         """Получава пълната геометрия за маршрут с множество точки от Valhalla."""
         try:
-            import requests
-            import json
-            from config import get_config
             
             valhalla_config = get_config().valhalla
             base_url = valhalla_config.base_url.rstrip('/')
@@ -1311,20 +1562,18 @@ class InteractiveMapGenerator:
             }
             
             route_url = f"{base_url}/route"
-            response = requests.post(route_url, json=route_request, timeout=30)
+            response = _post_json(route_url, route_request, timeout=30)
             response.raise_for_status()
             
-            data = response.json()
+            data = _response_json(response)
             
             if 'trip' in data and 'legs' in data['trip']:
-                geometry = []
-                for leg in data['trip']['legs']:
-                    if 'shape' in leg:
-                        decoded = self._decode_polyline(leg['shape'])
-                        if geometry:
-                            # Премахваме първата точка, за да няма дублиране
-                            decoded = decoded[1:] if decoded else decoded
-                        geometry.extend(decoded)
+                decode = self._decode_polyline_array if NUMBA_AVAILABLE else self._decode_polyline
+                geometry = self._assemble_geometry([
+                    decode(leg['shape'])
+                    for leg in data['trip']['legs']
+                    if 'shape' in leg
+                ])
                 
                 if geometry:
                     logger.info(f"✅ Valhalla маршрут геометрия получена: {len(geometry)} точки за {len(waypoints)} waypoints")
@@ -1336,21 +1585,16 @@ class InteractiveMapGenerator:
         except Exception as e:
             logger.warning(f"Грешка при Valhalla Route API заявка за пълен маршрут: {e}")
             # Fallback към последователност от сегменти
-            full_geometry = []
-            for i in range(len(waypoints) - 1):
-                segment = self._get_valhalla_route_geometry(waypoints[i], waypoints[i + 1])
-                if i == 0:
-                    full_geometry.extend(segment)
-                else:
-                    full_geometry.extend(segment[1:])
+            full_geometry = self._assemble_geometry([
+                self._get_valhalla_route_geometry(waypoints[i], waypoints[i + 1])
+                for i in range(len(waypoints) - 1)
+            ])
             
             return full_geometry if full_geometry else waypoints
     
     def _get_full_route_geometry_osrm(self, waypoints: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
         """Получава пълната геометрия за маршрут с множество точки от OSRM."""
         try:
-            import requests
-            from config import get_config
             
             # OSRM Route API заявка за целия маршрут
             osrm_config = get_config().osrm
@@ -1371,7 +1615,7 @@ class InteractiveMapGenerator:
                 coordinates = route['geometry']['coordinates']
                 
                 # Конвертираме от [lon,lat] към [lat,lon] за Folium
-                geometry = [(coord[1], coord[0]) for coord in coordinates]
+                geometry = self._assemble_geometry([coordinates], swap_xy=True)
                 
                 logger.info(f"✅ OSRM маршрут геометрия получена: {len(geometry)} точки за {len(waypoints)} waypoints")
                 return geometry
@@ -1382,13 +1626,10 @@ class InteractiveMapGenerator:
         except Exception as e:
             logger.warning(f"Грешка при OSRM Route API заявка за пълен маршрут: {e}")
             # Fallback към последователност от прави линии
-            full_geometry = []
-            for i in range(len(waypoints) - 1):
-                segment = self._get_osrm_route_geometry(waypoints[i], waypoints[i + 1])
-                if i == 0:
-                    full_geometry.extend(segment)
-                else:
-                    full_geometry.extend(segment[1:])  # Пропускаме дублираната точка
+            full_geometry = self._assemble_geometry([
+                self._get_osrm_route_geometry(waypoints[i], waypoints[i + 1])
+                for i in range(len(waypoints) - 1)
+            ])
             
             return full_geometry if full_geometry else waypoints
     
@@ -1396,33 +1637,21 @@ class InteractiveMapGenerator:
         """Добавя маршрутите на картата с OSRM геометрия и филтър за бусовете"""
         # Създаваме FeatureGroup за всеки автобус
         bus_layers = {}
+        color_iter = itertools.cycle(BUS_COLORS)
         
         for route_idx, route in enumerate(routes):
-            vehicle_settings = VEHICLE_SETTINGS.get(route.vehicle_type.value, {
-                'color': 'gray', 
-                'icon': 'circle',
-                'prefix': 'fa',
-                'name': 'Неизвестен'
-            })
+            vehicle_settings = VEHICLE_SETTINGS.get(route.vehicle_type.value, _DEFAULT_VEHICLE_SETTINGS)
             
             # Всеки автобус получава уникален цвят
-            bus_color = BUS_COLORS[route_idx % len(BUS_COLORS)]
+            bus_color = next(color_iter)
             bus_id = f"bus_{route_idx + 1}"
             
             # Създаваме FeatureGroup за този автобус
             bus_layer = folium.FeatureGroup(name=f"🚌 Автобус {route_idx + 1} ({len(route.customers)} клиента)")
             bus_layers[bus_id] = bus_layer
             
-            # Добавяне на клиентските маркери с номерация
-            for client_idx, customer in enumerate(route.customers):
-                if customer.coordinates:
-                    # Създаваме номериран маркер
-                    client_number = client_idx + 1
-                    navigation_url = self._navigation_url(customer.coordinates)
-                    street_view_url = self._street_view_url(customer.coordinates)
-                    
-                    # HTML за номерирано пинче с уникален цвят на автобуса
-                    icon_html = f'''
+            # Частите от HTML, които са общи за всички клиенти на автобуса
+            icon_html_prefix = f'''
                     <div style="
                         background-color: {bus_color};
                         border: 3px solid white;
@@ -1436,15 +1665,27 @@ class InteractiveMapGenerator:
                         font-size: 14px;
                         color: white;
                         text-shadow: 1px 1px 1px rgba(0,0,0,0.7);
-                    ">{client_number}</div>
-                    '''
-                    
-                    popup_text = f"""
+                    ">'''
+            popup_header = f"""
                     <div style="font-family: Arial, sans-serif;">
                         <h4 style="margin: 0; color: {bus_color};">
                             Автобус {route_idx + 1} - {vehicle_settings['name']}
                         </h4>
-                        <hr style="margin: 5px 0;">
+                        <hr style="margin: 5px 0;">"""
+            
+            # Добавяне на клиентските маркери с номерация
+            for client_idx, customer in enumerate(route.customers):
+                if customer.coordinates:
+                    # Създаваме номериран маркер
+                    client_number = client_idx + 1
+                    navigation_url = self._navigation_url(customer.coordinates)
+                    street_view_url = self._street_view_url(customer.coordinates)
+                    
+                    # HTML за номерирано пинче с уникален цвят на автобуса
+                    icon_html = f'''{icon_html_prefix}{client_number}</div>
+                    '''
+                    
+                    popup_text = f"""{popup_header}
                         <b>Клиент:</b> {customer.name}<br>
                         <b>ID:</b> {customer.id}<br>
                         <b>Ред в маршрута:</b> #{client_number}<br>
@@ -1614,55 +1855,60 @@ class InteractiveMapGenerator:
     
     def _add_legend(self, route_map: folium.Map, routes: List[Route]):
         """Добавя легенда на картата с информация за маршрутите"""
-        # Изчисляваме статистики
-        total_distance = sum(route.total_distance_km for route in routes)
-        total_time = sum(route.total_time_minutes for route in routes)
-        total_volume = sum(route.total_volume for route in routes)
-        routed_count = sum(1 for route in routes if self.use_routing)
-        
-        legend_html = f'''
+        use_routing = self.use_routing
+        
+        # Изчисляваме статистиките с едно обхождане на маршрутите
+        total_distance = total_time = total_volume = 0
+        for route in routes:
+            total_distance += route.total_distance_km
+            total_time += route.total_time_minutes
+            total_volume += route.total_volume
+        routed_count = len(routes) if use_routing else 0
+        
+        parts = []
+        parts.append(f'''
         <div style="position: fixed; 
                     top: 10px; left: 10px; width: 280px; height: auto; 
                     background-color: white; border:2px solid grey; z-index:9999; 
                     font-size:14px; padding: 10px; border-radius: 5px;
                     box-shadow: 0 0 15px rgba(0,0,0,0.2);">
         <h4 style="margin-top:0; margin-bottom:10px; text-align: center;">🗺️ Информация</h4>
-        '''
+        ''')
         
         # Добавяме депо
-        legend_html += '''
+        parts.append('''
         <p style="margin: 5px 0;">
             <i class="fa fa-home" style="color: black; margin-right: 8px;"></i>
             Депо
         </p>
-        '''
+        ''')
         
         # Добавяме информация за филтъра
-        legend_html += '''
+        parts.append('''
         <hr style="margin: 10px 0;">
         <p style="margin: 5px 0; font-weight: bold;">🚌 Филтър на автобуси:</p>
         <p style="margin: 5px 0; font-size: 12px; color: #666;">
             Използвай контрола в горния десен ъгъл за показване/скриване на отделни автобуси
             </p>
-            '''
+            ''')
         
         # Добавяме информация за маршрутите
-        if self.use_routing:
+        if use_routing:
             engine_name = "Valhalla" if self.routing_engine and self.routing_engine.value == RoutingEngine.VALHALLA.value else "OSRM"
             routing_status = f"🛣️ {engine_name} маршрути"
         else:
             routing_status = "📐 Прави линии"
         
-        legend_html += f'''
+        parts.append(f'''
         <hr style="margin: 10px 0;">
         <p style="margin: 5px 0; font-size: 12px; color: #666;">
             Числата показват реда на посещение<br>
             {routing_status}
         </p>
-        '''
+        ''')
         
         # Добавяме статистики
-        legend_html += f'''
+        parts.append(f'''
         <hr style="margin: 10px 0;">
         <p style="margin: 5px 0; font-size: 12px; font-weight: bold;">
             📊 Статистики:
@@ -1674,9 +1920,10 @@ class InteractiveMapGenerator:
             • Маршрути с геометрия: {routed_count}/{len(routes)}
         </p>
         </div>
-        '''
+        ''')
         
-        # Добавяме легендата към картата
+        # Добавяме легендата към картата - сглобяваме частите наведнъж
+        legend_html = "".join(parts)
         legend_element = folium.Element(legend_html)
         route_map.get_root().add_child(legend_element)
 
@@ -2272,15 +2519,12 @@ class InteractiveMapGenerator:
         self._add_depot_markers(route_map, [route_depot])
 
         # Добавяме център зоната
-        from config import get_config
         cfg = get_config()
         if cfg.locations.enable_center_zone_priority:
             self._add_center_zone_shape(route_map, cfg.locations)
 
         # Добавяме маршрута
-        vehicle_settings = VEHICLE_SETTINGS.get(route.vehicle_type.value, {
-            'color': 'gray', 'icon': 'circle', 'prefix': 'fa', 'name': 'Неизвестен'
-        })
+        vehicle_settings = VEHICLE_SETTINGS.get(route.vehicle_type.value, _DEFAULT_VEHICLE_SETTINGS)
         bus_color = BUS_COLORS[(route_number - 1) % len(BUS_COLORS)]
 
         bus_layer = folium.FeatureGroup(
@@ -2406,8 +2650,25 @@ class InteractiveMapGenerator:
 
         return route_map
 
+    def render_map_html(self, route_map) -> str:
+        """Връща пълния HTML на Folium карта или на GoogleMapDocument.
+        Резултатът се кешира за обекта на картата, затова картата не трябва да се
+        променя след първото рендериране.
+        """
+        if isinstance(route_map, GoogleMapDocument):
+            return route_map.html_content
+        html_content = self._rendered_html.get(route_map)
+        if html_content is None:
+            html_content = route_map.get_root().render()
+            self._rendered_html[route_map] = html_content
+        return html_content
+
     def save_map(self, route_map: folium.Map, file_path: Optional[str] = None) -> str:
         """Записва картата във файл"""
+        return self.write_map_html(self.render_map_html(route_map), file_path)
+
+    def write_map_html(self, html_content: str, file_path: Optional[str] = None) -> str:
+        """Записва вече рендериран HTML на карта (и gzip копие, ако е включено)"""
         file_path = _normalize_output_file_path(
             file_path or self.config.map_output_file,
             "interactive_map.html",
@@ -2415,90 +2676,551 @@ class InteractiveMapGenerator:
         file_path = _append_run_date_to_filename(file_path, self.run_date)
         
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        route_map.save(file_path)
+
+        # Кодираме HTML веднъж и го използваме и за gzip копието
+        html_content = html_content.encode("utf-8")
+        with open(file_path, "wb") as f:
+            f.write(html_content)
+
+        if getattr(self.config, "compress_map_output", False):
+            # Браузърите разархивират прозрачно при Content-Encoding: gzip
+            with gzip.open(f"{file_path}.gz", "wb", compresslevel=6) as f:
+                f.write(html_content)
+            logger.info(f"Компресирана карта записана в {file_path}.gz")
         
         logger.info(f"Интерактивна карта записана в {file_path}")
         return file_path
 
 
+# Стилове на общия Excel отчет, общи за всички Excel engine-и.
+# 'first_cell_only' оформя само първата клетка на реда (етикетите в обобщението).
+_EXCEL_STYLES: Dict[str, Dict] = {
+    'routes_header': {'bold': True, 'font_color': 'FFFFFF', 'bg_color': '366092', 'center': True},
+    'unserved_header': {'bold': True, 'font_color': 'FFFFFF', 'bg_color': 'C5504B', 'center': True},
+    'stats_header': {'bold': True, 'font_color': 'FFFFFF', 'bg_color': '70AD47', 'center': True},
+    'summary_title': {'bold': True, 'size': 14, 'first_cell_only': True},
+    'summary_label': {'bold': True, 'first_cell_only': True},
+    'summary_header': {'bold': True, 'bg_color': 'D9E1F2'},
+}
+
+
+# Колони на таблицата с маршрутите (Excel sheet "Маршрути" и CSV)
+_ROUTES_HEADERS = [
+    'Маршрут', 'Превозно средство', 'Ред в маршрута',
+    'Посока на движение', 'ID клиент', 'Име клиент', 'Номер поръчка', 'Обем (ст.)', 'GPS координати',
+    'Разстояние до центъра (км)', 'Депо стартова точка',
+    'Разстояние от предишен (км)', 'Накоплено разстояние (км)',
+    'Време от предишен (мин)', 'Накоплено време (мин)',
+    'Стартово време (мин)', 'Време с натрупване (мин)', 'Време с натрупване (чч:мм)'
+]
+
+
+# Букви на колоните A..IV, изчислени веднъж (get_column_letter е base-26 преобразуване)
+_COL_LETTERS = [get_column_letter(col) for col in range(1, 257)]
+
+
+# Статични части на .xlsx пакета за директния XML writer
+_XLSX_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_XLSX_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_XLSX_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XLSX_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_XLSX_ROOT_RELS = (
+    _XLSX_XML_HEADER
+    + f'<Relationships xmlns="{_XLSX_PKG_REL_NS}">'
+    + f'<Relationship Id="rId1" Type="{_XLSX_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+    + '</Relationships>'
+)
+
+
+@dataclass
+class _SheetData:
+    """Подготвени редове за един sheet - записват се от избрания Excel engine"""
+    name: str
+    rows: List[list]
+    col_widths: List[int]
+    row_styles: Dict[int, str] = field(default_factory=dict)  # индекс на ред -> ключ от _EXCEL_STYLES
+
+
 class ExcelExporter:
     """Експортър на Excel файлове"""
     
     def __init__(self, config: OutputConfig):
         self.config = config
         self.run_date = datetime.now().strftime("%Y-%m-%d")
+        # Кеш на конфигурациите по тип превозно средство (зарежда се при експорт)
+        self._vehicle_config_by_type: Optional[Dict] = None
+        self._global_start_time_minutes = 0
+        # Имена на превозните средства по тип (константни за целия експорт)
+        self._vehicle_name_by_type = {
+            vehicle_type: settings.get('name', 'Неизвестен')
+            for vehicle_type, settings in VEHICLE_SETTINGS.items()
+        }
+        # Стиловете (Font, Fill, Alignment) се създават веднъж и се преизползват за всички sheets
+        self._header_styles = {key: self._openpyxl_style(spec) for key, spec in _EXCEL_STYLES.items()}
+    
+    @staticmethod
+    def _openpyxl_style(spec: Dict) -> Tuple[Font, Optional[PatternFill], Optional[Alignment]]:
+        """Създава тройката (Font, Fill, Alignment) за openpyxl с ARGB цветове"""
+        font = Font(
+            bold=spec.get('bold', False),
+            color=f"FF{spec['font_color']}" if 'font_color' in spec else None,
+            size=spec.get('size'),
+        )
+        fill = None
+        if 'bg_color' in spec:
+            fill = PatternFill(start_color=f"FF{spec['bg_color']}", end_color=f"FF{spec['bg_color']}", fill_type="solid")
+        alignment = Alignment(horizontal="center", vertical="center") if spec.get('center') else None
+        return font, fill, alignment
+    
+    @staticmethod
+    def _xlsxwriter_properties(spec: Dict) -> Dict:
+        """Преобразува описание на стил от _EXCEL_STYLES в свойства за xlsxwriter add_format"""
+        properties = {'bold': spec.get('bold', False)}
+        if 'font_color' in spec:
+            properties['font_color'] = f"#{spec['font_color']}"
+        if 'bg_color' in spec:
+            properties['bg_color'] = f"#{spec['bg_color']}"
+        if 'size' in spec:
+            properties['font_size'] = spec['size']
+        if spec.get('center'):
+            properties['align'] = 'center'
+            properties['valign'] = 'vcenter'
+        return properties
+    
+    def _load_vehicle_configs(self) -> None:
+        """Зарежда веднъж конфигурациите по тип превозно средство и глобалното стартово време"""
+        main_config = get_config()
+        self._vehicle_config_by_type = {}
+        for vehicle_config in main_config.vehicles or []:
+            # Запазваме първата конфигурация за всеки тип (както при линейното търсене)
+            self._vehicle_config_by_type.setdefault(vehicle_config.vehicle_type, vehicle_config)
+        self._global_start_time_minutes = main_config.cvrp.global_start_time_minutes
     
     def export_all_to_single_excel(self, solution: CVRPSolution, warehouse_customers: List[Customer]) -> str:
         """Експортира всички данни в един Excel файл с отделни sheets"""
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        
         # Създаваме основния файл
         file_path = os.path.join(self.config.excel_output_dir, "cvrp_report.xlsx")
         file_path = _append_run_date_to_filename(file_path, self.run_date)
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
-        wb = Workbook()
+        sheets = self._build_report_sheets(solution, warehouse_customers)
         
-        # Премахваме default sheet
-        if wb.active:
-            wb.remove(wb.active)
+        # Записваме файла с избрания Excel engine
+        engine = (self.config.excel_engine or "openpyxl").lower()
+        if engine == "xlsxwriter" and XLSXWRITER_AVAILABLE:
+            self._write_report_xlsxwriter(sheets, file_path)
+        elif engine == "pyexcelerate" and PYEXCELERATE_AVAILABLE:
+            self._write_report_pyexcelerate(sheets, file_path)
+        elif engine == "xml":
+            self._write_report_raw_xml(sheets, file_path)
+        else:
+            if engine != "openpyxl":
+                logger.warning(f"⚠️ Excel engine '{engine}' не е наличен - използвам openpyxl")
+            self._write_report_openpyxl(sheets, file_path)
+        
+        logger.info(f"Общ Excel отчет записан в {file_path}")
+        return file_path
+    
+    def _build_report_sheets(self, solution: CVRPSolution, warehouse_customers: List[Customer]) -> List[_SheetData]:
+        """Подготвя редовете на всички sheets от общия отчет (без зависимост от Excel engine)"""
+        self._load_vehicle_configs()
+        
+        main_config = get_config()
+        
+        # Разстоянията се изчисляват наведнъж за всички клиенти
+        distances = self._precompute_distances(solution.routes, main_config.locations.center_location)
+        
+        tasks = []
         
         # 1. SHEET: Маршрути (Vehicle Routes)
         if solution.routes:
-            self._create_routes_sheet(wb, solution)
+            tasks.append(functools.partial(self._routes_sheet_data, solution, distances))
         
         # 2. SHEET: Необслужени клиенти (Unserved Customers)
         if warehouse_customers:
-            self._create_unserved_sheet(wb, warehouse_customers)
+            tasks.append(functools.partial(self._unserved_sheet_data, warehouse_customers))
         
         # 3. SHEET: Обобщение (Summary)
-        self._create_summary_sheet(wb, solution, warehouse_customers)
+        tasks.append(functools.partial(self._summary_sheet_data, solution, warehouse_customers))
         
         # 4. SHEET: Статистики по автобуси (Vehicle Statistics)
         if solution.routes:
-            self._create_vehicle_stats_sheet(wb, solution)
+            tasks.append(functools.partial(self._vehicle_stats_sheet_data, solution, distances))
+        
+        # Sheets са независими един от друг - подготвяме ги паралелно, а записът остава последователен.
+        # Чистият Python код е ограничен от GIL, но NumPy/Numba частите се изпълняват едновременно.
+        max_workers = min(main_config.performance.max_workers, len(tasks))
+        if max_workers <= 1:
+            return [task() for task in tasks]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda task: task(), tasks))
+    
+    def _write_report_openpyxl(self, sheets: List[_SheetData], file_path: str) -> None:
+        """Записва отчета с openpyxl в write_only режим"""
+        
+        # write_only режим - редовете се записват поточно, без да се пазят клетките в паметта
+        wb = Workbook(write_only=True)
+        
+        styles = self._header_styles
+        
+        for sheet in sheets:
+            ws = wb.create_sheet(sheet.name)
+            # Ширините се задават преди първия запис (write_only)
+            self._apply_column_widths(ws, sheet.col_widths)
+            
+            for row_idx, row in enumerate(sheet.rows):
+                style_key = sheet.row_styles.get(row_idx)
+                if style_key:
+                    styled_count = 1 if _EXCEL_STYLES[style_key].get('first_cell_only') else len(row)
+                    row = [
+                        self._styled_cell(ws, value, *styles[style_key]) if col < styled_count else value
+                        for col, value in enumerate(row)
+                    ]
+                ws.append(row)
+        
+        wb.save(file_path)
+    
+    def _write_report_xlsxwriter(self, sheets: List[_SheetData], file_path: str) -> None:
+        """Записва отчета с xlsxwriter в constant_memory режим (ред по ред, ограничена памет)"""
+        wb = xlsxwriter.Workbook(file_path, {
+            'constant_memory': True,
+            'strings_to_numbers': False,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        })
+        
+        # Форматите се създават веднъж и се преизползват за всички редове
+        formats = {key: wb.add_format(self._xlsxwriter_properties(spec)) for key, spec in _EXCEL_STYLES.items()}
+        
+        try:
+            for sheet in sheets:
+                ws = wb.add_worksheet(sheet.name)
+                for col, width in enumerate(sheet.col_widths):
+                    ws.set_column(col, col, min(width + 2, 50))
+                
+                for row_idx, row in enumerate(sheet.rows):
+                    if not row:
+                        continue
+                    style_key = sheet.row_styles.get(row_idx)
+                    if style_key is None:
+                        ws.write_row(row_idx, 0, row)
+                    elif _EXCEL_STYLES[style_key].get('first_cell_only'):
+                        ws.write(row_idx, 0, row[0], formats[style_key])
+                        ws.write_row(row_idx, 1, row[1:])
+                    else:
+                        ws.write_row(row_idx, 0, row, formats[style_key])
+        finally:
+            wb.close()
+
+    def _write_report_pyexcelerate(self, sheets: List[_SheetData], file_path: str) -> None:
+        """Записва отчета с PyExcelerate - всеки sheet се подава наведнъж като списък от редове.
+        Стилизират се само заглавните клетки, за да не се губи предимството в скоростта.
+        """
+        def color(hex_color: str) -> 'pyexcelerate.Color':
+            return pyexcelerate.Color(int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16))
+        
+        styles = {}
+        for key, spec in _EXCEL_STYLES.items():
+            font = pyexcelerate.Font(
+                bold=spec.get('bold', False),
+                size=spec.get('size', 11),
+                color=color(spec['font_color']) if 'font_color' in spec else None,
+            )
+            fill = pyexcelerate.Fill(background=color(spec['bg_color'])) if 'bg_color' in spec else None
+            alignment = pyexcelerate.Alignment(horizontal='center', vertical='center') if spec.get('center') else None
+            styles[key] = pyexcelerate.Style(font=font, fill=fill, alignment=alignment)
+        
+        wb = pyexcelerate.Workbook()
+        for sheet in sheets:
+            # Празните низове стават None - иначе PyExcelerate ги записва като клетки с празен низ,
+            # а openpyxl и xlsxwriter ги оставят празни
+            rows = [[None if value == '' else value for value in row] for row in sheet.rows]
+            ws = wb.new_sheet(sheet.name, data=rows)
+            for col, width in enumerate(sheet.col_widths, 1):
+                ws.set_col_style(col, pyexcelerate.Style(size=min(width + 2, 50)))
+            
+            for row_idx, style_key in sheet.row_styles.items():
+                row = sheet.rows[row_idx]
+                styled_count = 1 if _EXCEL_STYLES[style_key].get('first_cell_only') else len(row)
+                for col in range(1, styled_count + 1):
+                    ws.set_cell_style(row_idx + 1, col, styles[style_key])
         
-        # Записваме файла
         wb.save(file_path)
-        logger.info(f"Общ Excel отчет записан в {file_path}")
-        return file_path
+
+    def _write_report_raw_xml(self, sheets: List[_SheetData], file_path: str) -> None:
+        """Записва отчета директно като XML части в .xlsx архива, без Excel библиотека.
+        Низовете са inline (без shared strings таблица), а редовете се пишат поточно.
+        """
+        style_keys = list(_EXCEL_STYLES)
+        # Индекс 0 е стилът по подразбиране
+        style_ids = {key: idx for idx, key in enumerate(style_keys, 1)}
+        
+        with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            sheet_overrides = "".join(
+                f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+                f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                for n in range(1, len(sheets) + 1)
+            )
+            zf.writestr('[Content_Types].xml', (
+                _XLSX_XML_HEADER
+                + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                + '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                + '<Default Extension="xml" ContentType="application/xml"/>'
+                + '<Override PartName="/xl/workbook.xml" '
+                + 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                + '<Override PartName="/xl/styles.xml" '
+                + 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                + sheet_overrides
+                + '</Types>'
+            ))
+            zf.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+            
+            sheet_entries = "".join(
+                f'<sheet name={xml_quoteattr(sheet.name)} sheetId="{n}" r:id="rId{n}"/>'
+                for n, sheet in enumerate(sheets, 1)
+            )
+            zf.writestr('xl/workbook.xml', (
+                _XLSX_XML_HEADER
+                + f'<workbook xmlns="{_XLSX_NS}" xmlns:r="{_XLSX_REL_NS}">'
+                + f'<sheets>{sheet_entries}</sheets></workbook>'
+            ))
+            
+            relationships = "".join(
+                f'<Relationship Id="rId{n}" Type="{_XLSX_REL_NS}/worksheet" Target="worksheets/sheet{n}.xml"/>'
+                for n in range(1, len(sheets) + 1)
+            )
+            relationships += (
+                f'<Relationship Id="rId{len(sheets) + 1}" Type="{_XLSX_REL_NS}/styles" Target="styles.xml"/>'
+            )
+            zf.writestr('xl/_rels/workbook.xml.rels', (
+                _XLSX_XML_HEADER
+                + f'<Relationships xmlns="{_XLSX_PKG_REL_NS}">{relationships}</Relationships>'
+            ))
+            zf.writestr('xl/styles.xml', self._raw_xml_styles(style_keys))
+            
+            for n, sheet in enumerate(sheets, 1):
+                self._write_sheet_raw_xml(zf, f'xl/worksheets/sheet{n}.xml', sheet, style_ids)
+    
+    @staticmethod
+    def _raw_xml_styles(style_keys: List[str]) -> str:
+        """Генерира xl/styles.xml със стиловете от _EXCEL_STYLES (в реда на style_keys)"""
+        fonts = ['<font><sz val="11"/><name val="Calibri"/></font>']
+        fills = ['<fill><patternFill patternType="none"/></fill>', '<fill><patternFill patternType="gray125"/></fill>']
+        xfs = ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>']
+        
+        for key in style_keys:
+            spec = _EXCEL_STYLES[key]
+            font = '<b/>' if spec.get('bold') else ''
+            font += f'<sz val="{spec.get("size", 11)}"/>'
+            if 'font_color' in spec:
+                font += f'<color rgb="FF{spec["font_color"]}"/>'
+            fonts.append(f'<font>{font}<name val="Calibri"/></font>')
+            font_id = len(fonts) - 1
+            
+            fill_id = 0
+            if 'bg_color' in spec:
+                fills.append(
+                    f'<fill><patternFill patternType="solid"><fgColor rgb="FF{spec["bg_color"]}"/>'
+                    f'<bgColor indexed="64"/></patternFill></fill>'
+                )
+                fill_id = len(fills) - 1
+            
+            if spec.get('center'):
+                xfs.append(
+                    f'<xf numFmtId="0" fontId="{font_id}" fillId="{fill_id}" borderId="0" xfId="0" '
+                    f'applyFont="1" applyFill="1" applyAlignment="1">'
+                    f'<alignment horizontal="center" vertical="center"/></xf>'
+                )
+            else:
+                xfs.append(
+                    f'<xf numFmtId="0" fontId="{font_id}" fillId="{fill_id}" borderId="0" xfId="0" '
+                    f'applyFont="1" applyFill="1"/>'
+                )
+        
+        return (
+            _XLSX_XML_HEADER
+            + f'<styleSheet xmlns="{_XLSX_NS}">'
+            + f'<fonts count="{len(fonts)}">{"".join(fonts)}</fonts>'
+            + f'<fills count="{len(fills)}">{"".join(fills)}</fills>'
+            + '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            + '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            + f'<cellXfs count="{len(xfs)}">{"".join(xfs)}</cellXfs>'
+            + '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            + '</styleSheet>'
+        )
+    
+    @staticmethod
+    def _write_sheet_raw_xml(zf: zipfile.ZipFile, part_name: str, sheet: _SheetData,
+                             style_ids: Dict[str, int]) -> None:
+        """Пише един worksheet поточно - в паметта се държи само текущият ред"""
+        column_count = max([len(sheet.col_widths)] + [len(row) for row in sheet.rows])
+        if column_count <= len(_COL_LETTERS):
+            col_letters = _COL_LETTERS
+        else:
+            col_letters = [get_column_letter(col) for col in range(1, column_count + 1)]
+        
+        with zf.open(part_name, 'w') as fh:
+            cols = "".join(
+                f'<col min="{col}" max="{col}" width="{min(width + 2, 50)}" customWidth="1"/>'
+                for col, width in enumerate(sheet.col_widths, 1)
+            )
+            fh.write((
+                _XLSX_XML_HEADER
+                + f'<worksheet xmlns="{_XLSX_NS}">'
+                + (f'<cols>{cols}</cols>' if cols else '')
+                + '<sheetData>'
+            ).encode('utf-8'))
+            
+            for row_idx, row in enumerate(sheet.rows):
+                if not row:
+                    continue
+                row_number = row_idx + 1
+                style_key = sheet.row_styles.get(row_idx)
+                styled_count = 0
+                style_attr = ''
+                if style_key:
+                    styled_count = 1 if _EXCEL_STYLES[style_key].get('first_cell_only') else len(row)
+                    style_attr = f' s="{style_ids[style_key]}"'
+                
+                parts = [f'<row r="{row_number}">']
+                for col, value in enumerate(row):
+                    # Празните низове се пропускат като None - openpyxl и xlsxwriter ги оставят празни клетки
+                    if value is None or value == '':
+                        continue
+                    ref = f'{col_letters[col]}{row_number}'
+                    s_attr = style_attr if col < styled_count else ''
+                    if isinstance(value, bool):
+                        parts.append(f'<c r="{ref}"{s_attr} t="b"><v>{int(value)}</v></c>')
+                    elif isinstance(value, (int, float)):
+                        parts.append(f'<c r="{ref}"{s_attr}><v>{value!r}</v></c>')
+                    else:
+                        parts.append(
+                            f'<c r="{ref}"{s_attr} t="inlineStr"><is>'
+                            f'<t xml:space="preserve">{xml_escape(str(value))}</t></is></c>'
+                        )
+                parts.append('</row>')
+                fh.write("".join(parts).encode('utf-8'))
+            
+            fh.write(b'</sheetData></worksheet>')
 
     def _format_movement_direction(self, from_stop: str, to_stop: str) -> str:
         return f"{from_stop} -> {to_stop}"
     
-    def _create_routes_sheet(self, wb, solution: CVRPSolution):
-        """Създава sheet с маршрутите"""
-        ws = wb.create_sheet("Маршрути")
-        
-        # Заглавни редове
-        headers = [
-            'Маршрут', 'Превозно средство', 'Ред в маршрута', 
-            'Посока на движение', 'ID клиент', 'Име клиент', 'Номер поръчка', 'Обем (ст.)', 'GPS координати',
-            'Разстояние до центъра (км)', 'Депо стартова точка',
-            'Разстояние от предишен (км)', 'Накоплено разстояние (км)',
-            'Време от предишен (мин)', 'Накоплено време (мин)',
-            'Стартово време (мин)', 'Време с натрупване (мин)', 'Време с натрупване (чч:мм)'
-        ]
+    @staticmethod
+    def _styled_cell(ws, value, font=None, fill=None, alignment=None) -> Cell:
+        """Създава клетка със стил за write_only sheet"""
+        cell = WriteOnlyCell(ws, value=value)
+        if font is not None:
+            cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if alignment is not None:
+            cell.alignment = alignment
+        return cell
+    
+    @staticmethod
+    def _track_column_widths(col_widths: List[int], row: list) -> None:
+        """Обновява максималната дължина на всяка колона с поредния ред"""
+        for col, value in enumerate(row):
+            length = len(str(value)) if value is not None else 0
+            if col >= len(col_widths):
+                col_widths.append(length)
+            elif length > col_widths[col]:
+                col_widths[col] = length
+    
+    @staticmethod
+    def _apply_column_widths(ws, col_widths: List[int]) -> None:
+        """Задава ширината на колоните веднъж за колона.
+        В write_only режим ширините трябва да са зададени преди първия ws.append.
+        """
+        for col, width in enumerate(col_widths):
+            letter = _COL_LETTERS[col] if col < len(_COL_LETTERS) else get_column_letter(col + 1)
+            ws.column_dimensions[letter].width = min(width + 2, 50)
+    
+    def _precompute_distances(self, routes: List[Route], center_location: Optional[Tuple[float, float]]
+                              ) -> Tuple[Dict[Tuple[int, int], float], Dict[Tuple[int, int], float]]:
+        """Изчислява с NumPy разстоянията до центъра и от предишната спирка за всички клиенти.
+        Връща два речника с ключ (индекс на маршрут, индекс на клиент).
+        С Numba вторият речник е празен - _route_metrics изчислява разстоянията от
+        предишната спирка в компилирания цикъл и не го използва.
+        """
+        missing = (np.nan, np.nan)
+        need_previous = not NUMBA_AVAILABLE
+        keys = []
+        points = []
+        previous_points = []
         
-        # Стилове за заглавния ред
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
+        for route_idx, route in enumerate(routes):
+            previous_coords = route.depot_location  # Започваме от депото
+            for cust_idx, customer in enumerate(route.customers):
+                keys.append((route_idx, cust_idx))
+                points.append(customer.coordinates or missing)
+                if need_previous:
+                    previous_points.append(previous_coords or missing)
+                    previous_coords = customer.coordinates
+        
+        if not keys:
+            return {}, {}
+        
+        coords = np.asarray(points, dtype=np.float64)
+        
+        if center_location:
+            center = np.broadcast_to(np.asarray(center_location, dtype=np.float64), coords.shape)
+            to_center = _haversine_km_array(coords, center)
+        else:
+            to_center = np.zeros(len(keys))
         
-        # Добавяме заглавния ред
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
+        from_previous_map = {}
+        if need_previous:
+            from_previous = _haversine_km_array(np.asarray(previous_points, dtype=np.float64), coords)
+            from_previous_map = dict(zip(keys, from_previous.tolist()))
         
-        # Данни за маршрутите
-        row = 2
-        center_location = get_config().locations.center_location
+        return dict(zip(keys, to_center.tolist())), from_previous_map
+    
+    def _route_metrics(self, route_idx: int, route: Route, distance_from_previous_map: Dict[Tuple[int, int], float],
+                       service_time_minutes: float, minutes_per_km: float,
+                       start_time_minutes: float) -> Tuple[List[float], ...]:
+        """Метрики по спирки за маршрут: разстояние от предишен, натрупано разстояние,
+        време за стъпката, натрупано време и време със старта.
+        С Numba се изчисляват в един компилиран цикъл, иначе - от предварително изчислените разстояния.
+        """
+        if NUMBA_AVAILABLE and route.customers:
+            missing = (np.nan, np.nan)
+            coords = np.array([customer.coordinates or missing for customer in route.customers], dtype=np.float64)
+            depot = np.array(route.depot_location or missing, dtype=np.float64)
+            metrics = _compute_route_metrics(
+                np.deg2rad(coords), np.deg2rad(depot),
+                float(service_time_minutes), float(minutes_per_km), float(start_time_minutes),
+            )
+            return tuple(values.tolist() for values in metrics)
+        
+        dist_prev, cum_dist, time_step, cum_time, time_with_start = [], [], [], [], []
+        cumulative_distance = 0
+        cumulative_time = 0
+        for j in range(len(route.customers)):
+            distance_from_previous = distance_from_previous_map[(route_idx, j)]
+            cumulative_distance += distance_from_previous
+            # Времето от предишния клиент (приблизително) + service time за текущия клиент
+            total_time_for_this_step = distance_from_previous * minutes_per_km + service_time_minutes
+            cumulative_time += total_time_for_this_step
+            
+            dist_prev.append(distance_from_previous)
+            cum_dist.append(cumulative_distance)
+            time_step.append(total_time_for_this_step)
+            cum_time.append(cumulative_time)
+            time_with_start.append(start_time_minutes + cumulative_time)
+        return dist_prev, cum_dist, time_step, cum_time, time_with_start
+    
+    def _iter_route_rows(self, solution: CVRPSolution,
+                         distances: Optional[Tuple[Dict, Dict]] = None) -> Iterator[list]:
+        """Генерира по един ред от таблицата с маршрутите за всеки обслужен клиент"""
+        if distances is None:
+            distances = self._precompute_distances(solution.routes, get_config().locations.center_location)
+        distance_to_center_map, distance_from_previous_map = distances
+        minutes_per_km = self.config.minutes_per_km
         
         for i, route in enumerate(solution.routes):
-            vehicle_name = VEHICLE_SETTINGS.get(route.vehicle_type.value, {}).get('name', 'Неизвестен')
+            vehicle_name = self._vehicle_name_by_type.get(route.vehicle_type.value, 'Неизвестен')
             
             # Изчисляваме стартово време за този тип превозно средство
             start_time_minutes = self._get_start_time_for_vehicle(route.vehicle_type)
@@ -2506,39 +3228,17 @@ class ExcelExporter:
             # Взимаме service time за този тип превозно средство
             vehicle_config = self._get_vehicle_config(route.vehicle_type)
             service_time_minutes = vehicle_config.service_time_minutes if vehicle_config else 15
+            depot_str = f"{route.depot_location[0]:.6f}, {route.depot_location[1]:.6f}"
             
-            # Изчисляваме разстоянията и времената между клиентите
-            cumulative_distance = 0
-            cumulative_time = 0
-            previous_customer_coords = route.depot_location  # Започваме от депото
+            # Разстоянията и времената между клиентите за целия маршрут наведнъж
+            metrics = self._route_metrics(
+                i, route, distance_from_previous_map, service_time_minutes, minutes_per_km, start_time_minutes
+            )
             previous_stop_name = "Депо"
             
-            for j, customer in enumerate(route.customers):
-                # Изчисляваме разстоянието до центъра
-                distance_to_center = self._calculate_distance_to_center(customer.coordinates, center_location) if customer.coordinates else 0.0
-                
-                # Изчисляваме разстоянието от предишния клиент
-                distance_from_previous = self._calculate_distance_between_points(
-                    previous_customer_coords, customer.coordinates
-                ) if customer.coordinates else 0.0
-                cumulative_distance += distance_from_previous
-                
-                # Изчисляваме времето от предишния клиент (приблизително)
-                time_from_previous = self._calculate_time_between_points(
-                    previous_customer_coords, customer.coordinates
-                ) if customer.coordinates else 0.0
-                
-                # Добавяме service time за текущия клиент
-                total_time_for_this_step = time_from_previous + service_time_minutes
-                cumulative_time += total_time_for_this_step
-                
-                # Изчисляваме времето с натрупване (стартово време + натрупване)
-                total_time_with_start = start_time_minutes + cumulative_time
-                
-                # Проверяваме дали клиентът е в център зоната
-                is_in_center_zone = is_location_in_center_zone(customer.coordinates, get_config().locations)
-                
-                data = [
+            for j, (customer, distance_from_previous, cumulative_distance, total_time_for_this_step,
+                    cumulative_time, total_time_with_start) in enumerate(zip(route.customers, *metrics)):
+                yield [
                     i + 1,  # Маршрут
                     vehicle_name,  # Превозно средство
                     j + 1,  # Ред в маршрута
@@ -2548,8 +3248,8 @@ class ExcelExporter:
                     customer.document,  # Номер поръчка
                     customer.volume,  # Обем
                     customer.original_gps_data,  # GPS
-                    round(distance_to_center, 2),  # Разстояние до центъра
-                    f"{route.depot_location[0]:.6f}, {route.depot_location[1]:.6f}",  # Депо
+                    round(distance_to_center_map[(i, j)], 2),  # Разстояние до центъра
+                    depot_str,  # Депо
                     round(distance_from_previous, 2),  # Разстояние от предишен
                     round(cumulative_distance, 2),  # Накоплено разстояние
                     round(total_time_for_this_step, 1),  # Време от предишен + service time
@@ -2559,50 +3259,30 @@ class ExcelExporter:
                     self._format_time_hh_mm(int(total_time_with_start))  # Време с натрупване (чч:мм)
                 ]
                 
-                for col, value in enumerate(data, 1):
-                    ws.cell(row=row, column=col, value=value)
-                
-                row += 1
-                previous_customer_coords = customer.coordinates
                 previous_stop_name = customer.name
-        
-        # Автоматично разширяване на колоните
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
     
-    def _create_unserved_sheet(self, wb, warehouse_customers: List[Customer]):
-        """Създава sheet с необслужените клиенти"""
-        ws = wb.create_sheet("Необслужени клиенти")
+    def _routes_sheet_data(self, solution: CVRPSolution, distances: Tuple[Dict, Dict]) -> _SheetData:
+        """Подготвя sheet с маршрутите"""
+        rows = [_ROUTES_HEADERS]
+        col_widths = [len(h) for h in _ROUTES_HEADERS]
+        
+        for data in self._iter_route_rows(solution, distances):
+            rows.append(data)
+            self._track_column_widths(col_widths, data)
         
+        return _SheetData("Маршрути", rows, col_widths, {0: 'routes_header'})
+    
+    def _unserved_sheet_data(self, warehouse_customers: List[Customer]) -> _SheetData:
+        """Подготвя sheet с необслужените клиенти"""
         headers = [
             'ID', 'Име', 'Обем (ст.)', 'GPS координати', 
             'Latitude', 'Longitude', 'Разстояние до центъра (км)'
         ]
         
-        # Стилове за заглавния ред
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="C5504B", end_color="C5504B", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Добавяме заглавния ред
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        
         # Данни
         center_location = get_config().locations.center_location
-        row = 2
+        rows = [headers]
+        col_widths = [len(h) for h in headers]
         
         for customer in warehouse_customers:
             distance_to_center = self._calculate_distance_to_center(customer.coordinates, center_location)
@@ -2616,174 +3296,123 @@ class ExcelExporter:
                 customer.coordinates[1] if customer.coordinates else '',
                 round(distance_to_center, 2)
             ]
-            
-            for col, value in enumerate(data, 1):
-                ws.cell(row=row, column=col, value=value)
-            
-            row += 1
+            rows.append(data)
+            self._track_column_widths(col_widths, data)
         
-        # Автоматично разширяване на колоните
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        return _SheetData("Необслужени клиенти", rows, col_widths, {0: 'unserved_header'})
     
-    def _create_summary_sheet(self, wb, solution: CVRPSolution, warehouse_customers: List[Customer]):
-        """Създава sheet с обобщение"""
-        ws = wb.create_sheet("Обобщение")
-        
-        # Стилове
-        title_font = Font(bold=True, size=14)
-        header_font = Font(bold=True)
-        header_fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-        
-        # Заглавие
-        ws['A1'] = "CVRP ОТЧЕТ - ОБОБЩЕНИЕ"
-        ws['A1'].font = title_font
+    def _summary_sheet_data(self, solution: CVRPSolution, warehouse_customers: List[Customer]) -> _SheetData:
+        """Подготвя sheet с обобщение"""
+        rows = []
+        col_widths: List[int] = []
+        row_styles: Dict[int, str] = {}
+        
+        def add_row(data: list, style: Optional[str] = None) -> None:
+            if style:
+                row_styles[len(rows)] = style
+            rows.append(data)
+            self._track_column_widths(col_widths, data)
+        
+        # Заглавие (ред 1) и празен ред 2
+        add_row(["CVRP ОТЧЕТ - ОБОБЩЕНИЕ"], 'summary_title')
+        add_row([])
+        
+        # Едно минаване по маршрутите - общи суми и статистики по тип автобус
+        # (типовете се пазят в реда на първата им поява)
+        served_customers = 0
+        total_volume = 0
+        vehicle_stats = {}
+        for route in solution.routes:
+            customers_count = len(route.customers)
+            served_customers += customers_count
+            total_volume += route.total_volume
+            
+            vehicle_type = route.vehicle_type.value
+            if vehicle_type not in vehicle_stats:
+                vehicle_stats[vehicle_type] = {
+                    'vehicle_type': route.vehicle_type,
+                    'count': 0, 'distance': 0, 'volume': 0, 'customers': 0
+                }
+            stats = vehicle_stats[vehicle_type]
+            stats['count'] += 1
+            stats['distance'] += route.total_distance_km
+            stats['volume'] += route.total_volume
+            stats['customers'] += customers_count
         
         # Основни статистики
-        row = 3
         stats = [
-            ("Общо клиенти", len(solution.routes) + len(warehouse_customers)),
-            ("Обслужени клиенти", sum(len(route.customers) for route in solution.routes)),
+            ("Общо клиенти", served_customers + len(warehouse_customers)),
+            ("Обслужени клиенти", served_customers),
             ("Необслужени клиенти", len(warehouse_customers)),
             ("Брой маршрути", len(solution.routes)),
             ("Общо разстояние (км)", round(solution.total_distance_km, 2)),
             ("Общо време (мин)", round(solution.total_time_minutes, 2)),
-            ("Общ обем (ст.)", round(sum(route.total_volume for route in solution.routes), 2))
+            ("Общ обем (ст.)", round(total_volume, 2))
         ]
         
         for stat_name, stat_value in stats:
-            ws[f'A{row}'] = stat_name
-            ws[f'A{row}'].font = header_font
-            ws[f'B{row}'] = stat_value
-            row += 1
+            add_row([stat_name, stat_value], 'summary_label')
         
         # Информация за стартови времена
-        row += 2
-        ws[f'A{row}'] = "СТАРТОВИ ВРЕМЕНА ПО ТИП АВТОБУС"
-        ws[f'A{row}'].font = title_font
-        row += 1
+        add_row([])
+        add_row([])
+        add_row(["СТАРТОВИ ВРЕМЕНА ПО ТИП АВТОБУС"], 'summary_title')
         
         # Заглавни редове за стартови времена
         start_time_headers = ['Тип автобус', 'Стартово време (мин)', 'Стартово време (чч:мм)']
-        for col, header in enumerate(start_time_headers, 1):
-            cell = ws.cell(row=row, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-        row += 1
+        add_row(start_time_headers, 'summary_header')
         
         # Данни за стартови времена
-        vehicle_types_seen = set()
-        for route in solution.routes:
-            if route.vehicle_type.value not in vehicle_types_seen:
-                vehicle_types_seen.add(route.vehicle_type.value)
-                vehicle_name = VEHICLE_SETTINGS.get(route.vehicle_type.value, {}).get('name', route.vehicle_type.value)
-                start_time_minutes = self._get_start_time_for_vehicle(route.vehicle_type)
-                
-                data = [
-                    vehicle_name,
-                    start_time_minutes,
-                    self._format_time_hh_mm(start_time_minutes)
-                ]
-                for col, value in enumerate(data, 1):
-                    ws.cell(row=row, column=col, value=value)
-                row += 1
+        for vehicle_type, stats in vehicle_stats.items():
+            vehicle_name = self._vehicle_name_by_type.get(vehicle_type, vehicle_type)
+            start_time_minutes = self._get_start_time_for_vehicle(stats['vehicle_type'])
+            
+            add_row([
+                vehicle_name,
+                start_time_minutes,
+                self._format_time_hh_mm(start_time_minutes)
+            ])
         
         # Статистики по тип автобус
-        row += 2
-        ws[f'A{row}'] = "СТАТИСТИКИ ПО ТИП АВТОБУС"
-        ws[f'A{row}'].font = title_font
-        row += 1
-        
-        vehicle_stats = {}
-        for route in solution.routes:
-            vehicle_type = route.vehicle_type.value
-            if vehicle_type not in vehicle_stats:
-                vehicle_stats[vehicle_type] = {
-                    'count': 0, 'distance': 0, 'volume': 0, 'customers': 0
-                }
-            vehicle_stats[vehicle_type]['count'] += 1
-            vehicle_stats[vehicle_type]['distance'] += route.total_distance_km
-            vehicle_stats[vehicle_type]['volume'] += route.total_volume
-            vehicle_stats[vehicle_type]['customers'] += len(route.customers)
+        add_row([])
+        add_row([])
+        add_row(["СТАТИСТИКИ ПО ТИП АВТОБУС"], 'summary_title')
         
         # Заглавни редове за статистики
         headers = ['Тип автобус', 'Брой маршрути', 'Общо разстояние (км)', 'Общ обем (ст.)', 'Общо клиенти']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=row, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-        row += 1
+        add_row(headers, 'summary_header')
         
         # Данни за статистики
         for vehicle_type, stats in vehicle_stats.items():
-            vehicle_name = VEHICLE_SETTINGS.get(vehicle_type, {}).get('name', vehicle_type)
-            data = [
+            vehicle_name = self._vehicle_name_by_type.get(vehicle_type, vehicle_type)
+            add_row([
                 vehicle_name,
                 stats['count'],
                 round(stats['distance'], 2),
                 round(stats['volume'], 2),
                 stats['customers']
-            ]
-            for col, value in enumerate(data, 1):
-                ws.cell(row=row, column=col, value=value)
-            row += 1
-        
-        # Автоматично разширяване на колоните
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-    
-    def _create_vehicle_stats_sheet(self, wb, solution: CVRPSolution):
-        """Създава sheet със статистики по отделни автобуси"""
-        ws = wb.create_sheet("Статистики по автобуси")
+            ])
         
+        return _SheetData("Обобщение", rows, col_widths, row_styles)
+    
+    def _vehicle_stats_sheet_data(self, solution: CVRPSolution, distances: Tuple[Dict, Dict]) -> _SheetData:
+        """Подготвя sheet със статистики по отделни автобуси"""
         headers = [
             'Маршрут', 'Тип автобус', 'Брой клиенти', 'Общ обем (ст.)',
             'Разстояние (км)', 'Време (мин)', 'Капацитет използване (%)',
             'Средно разстояние до центъра (км)', 'Депо стартова точка', 'Стартово време (чч:мм)'
         ]
         
-        # Стилове за заглавния ред
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="70AD47", end_color="70AD47", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Добавяме заглавния ред
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        
         # Данни
-        center_location = get_config().locations.center_location
-        row = 2
+        distance_to_center_map = distances[0]
+        rows = [headers]
+        col_widths = [len(h) for h in headers]
         
         for i, route in enumerate(solution.routes):
-            vehicle_name = VEHICLE_SETTINGS.get(route.vehicle_type.value, {}).get('name', 'Неизвестен')
+            vehicle_name = self._vehicle_name_by_type.get(route.vehicle_type.value, 'Неизвестен')
             
             # Изчисляваме средното разстояние до центъра
-            distances_to_center = []
-            for customer in route.customers:
-                distance = self._calculate_distance_to_center(customer.coordinates, center_location)
-                distances_to_center.append(distance)
+            distances_to_center = [distance_to_center_map[(i, j)] for j in range(len(route.customers))]
             avg_distance_to_center = sum(distances_to_center) / len(distances_to_center) if distances_to_center else 0
             
             # Капацитет използване (трябва да вземем capacity от config)
@@ -2807,31 +3436,18 @@ class ExcelExporter:
                 f"{route.depot_location[0]:.6f}, {route.depot_location[1]:.6f}",  # Депо
                 self._format_time_hh_mm(start_time_minutes) # Стартово време (чч:мм)
             ]
-            
-            for col, value in enumerate(data, 1):
-                ws.cell(row=row, column=col, value=value)
-            
-            row += 1
+            rows.append(data)
+            self._track_column_widths(col_widths, data)
         
-        # Автоматично разширяване на колоните
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        return _SheetData("Статистики по автобуси", rows, col_widths, {0: 'stats_header'})
+    
+
     
     def _calculate_distance_to_center(self, coordinates: Optional[Tuple[float, float]], center_location: Tuple[float, float]) -> float:
         """Изчислява разстоянието до центъра в км"""
         if not coordinates or not center_location:
             return 0.0
         
-        from math import radians, sin, cos, sqrt, atan2
         R = 6371  # Earth radius in km
         
         lat1, lon1 = radians(coordinates[0]), radians(coordinates[1])
@@ -2845,45 +3461,11 @@ class ExcelExporter:
         
         return R * c
     
-    def _calculate_distance_between_points(self, point1: Optional[Tuple[float, float]], point2: Optional[Tuple[float, float]]) -> float:
-        """Изчислява разстоянието между две точки в км"""
-        if not point1 or not point2:
-            return 0.0
-        
-        from math import radians, sin, cos, sqrt, atan2
-        R = 6371  # Earth radius in km
-        
-        lat1, lon1 = radians(point1[0]), radians(point1[1])
-        lat2, lon2 = radians(point2[0]), radians(point2[1])
-        
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = sin(dlat/2)**2 + cos(lat1)*cos(lat2)*sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        
-        return R * c
-    
-    def _calculate_time_between_points(self, point1: Optional[Tuple[float, float]], point2: Optional[Tuple[float, float]]) -> float:
-        """Изчислява времето за пътуване между две точки в минути (приблизително)"""
-        if not point1 or not point2:
-            return 0.0
-        
-        distance_km = self._calculate_distance_between_points(point1, point2)
-        # Приблизително време за пътуване: 2 минути на км (градски транспорт)
-        # Това включва спирачки, светофари, задръствания и т.н.
-        return distance_km * 2
-
     def _get_vehicle_config(self, vehicle_type):
         """Връща конфигурацията за даден тип превозно средство"""
-        from config import get_config
-        vehicle_configs = get_config().vehicles
-        
-        if vehicle_configs:
-            for config in vehicle_configs:
-                if config.vehicle_type == vehicle_type:
-                    return config
-        return None
+        if self._vehicle_config_by_type is None:
+            self._load_vehicle_configs()
+        return self._vehicle_config_by_type.get(vehicle_type)
     
     def _get_start_time_for_vehicle(self, vehicle_type) -> int:
         """Връща стартово време в минути за даден тип превозно средство"""
@@ -2892,15 +3474,127 @@ class ExcelExporter:
             return vehicle_config.start_time_minutes
         else:
             # Използваме глобалното стартово време от конфигурацията
-            from config import get_config
-            return get_config().cvrp.global_start_time_minutes
+            return self._global_start_time_minutes
     
-    def _format_time_hh_mm(self, total_minutes: int) -> str:
-        """Форматира време в минути като чч:мм"""
-        hours = total_minutes // 60
-        minutes = total_minutes % 60
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _format_time_hh_mm(total_minutes: int) -> str:
+        """Форматира време в минути като чч:мм (кешира се - стойностите се повтарят често)"""
+        hours, minutes = divmod(total_minutes, 60)
         return f"{hours:02d}:{minutes:02d}"
     
+    def _write_rows_xlsxwriter(self, rows: Iterator[list], headers: List[str], file_path: str,
+                               sheet_name: str = "Sheet1",
+                               column_formats: Optional[Dict[str, str]] = None) -> None:
+        """Записва редове директно с xlsxwriter в constant_memory режим (без pandas).
+        Форматът на заглавието и number format-ите по колони се създават веднъж.
+        """
+        wb = xlsxwriter.Workbook(file_path, {
+            'constant_memory': True,
+            'strings_to_numbers': False,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        })
+        try:
+            ws = wb.add_worksheet(sheet_name)
+            header_format = wb.add_format(self._xlsxwriter_properties(_EXCEL_STYLES['routes_header']))
+            ws.write_row(0, 0, headers, header_format)
+            
+            # В constant_memory режим форматът на колоната се прилага към клетките при запис,
+            # затова трябва да е зададен преди редовете
+            number_formats = {}
+            column_format_by_col = {}
+            for col, header in enumerate(headers):
+                num_format = (column_formats or {}).get(header)
+                if num_format:
+                    if num_format not in number_formats:
+                        number_formats[num_format] = wb.add_format({'num_format': num_format})
+                    column_format_by_col[col] = number_formats[num_format]
+                    ws.set_column(col, col, None, column_format_by_col[col])
+            
+            col_widths = [len(h) for h in headers]
+            for row_idx, row in enumerate(rows, 1):
+                ws.write_row(row_idx, 0, row)
+                self._track_column_widths(col_widths, row)
+            
+            # Ширините се записват при затваряне на файла, затова може да се зададат след редовете
+            for col, width in enumerate(col_widths):
+                ws.set_column(col, col, min(width + 2, 50), column_format_by_col.get(col))
+        finally:
+            wb.close()
+    
+    def _write_dataframe_openpyxl(self, df: pd.DataFrame, file_path: str, sheet_name: str,
+                                  column_formats: Optional[Dict[str, str]] = None) -> None:
+        """Записва DataFrame с openpyxl в write_only режим - по един ws.append на ред,
+        без df.to_excel, който създава и стилизира всяка клетка поотделно.
+        """
+        
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(sheet_name)
+        
+        headers = [str(column) for column in df.columns]
+        formats = [(column_formats or {}).get(column) for column in df.columns]
+        
+        # Липсващите стойности (NaN) остават празни клетки, както при df.to_excel
+        rows = []
+        col_widths = [len(h) for h in headers]
+        for values in df.itertuples(index=False, name=None):
+            row = [None if pd.isna(value) else value for value in values]
+            rows.append(row)
+            self._track_column_widths(col_widths, row)
+        self._apply_column_widths(ws, col_widths)
+        
+        header_font, header_fill, header_alignment = self._header_styles['routes_header']
+        ws.append([self._styled_cell(ws, h, header_font, header_fill, header_alignment) for h in headers])
+        
+        formatted_columns = [col for col, num_format in enumerate(formats) if num_format]
+        for row in rows:
+            for col in formatted_columns:
+                if row[col] is not None:
+                    cell = WriteOnlyCell(ws, value=row[col])
+                    cell.number_format = formats[col]
+                    row[col] = cell
+            ws.append(row)
+        
+        wb.save(file_path)
+    
+    def _write_dataframe_excel(self, df: pd.DataFrame, file_path: str, sheet_name: str = "Sheet1",
+                               column_formats: Optional[Dict[str, str]] = None) -> None:
+        """Записва DataFrame в Excel през xlsxwriter с форматиране на ниво ред/колона.
+
+        column_formats съпоставя име на колона с Excel number format (напр. '0.00'),
+        който се прилага веднъж за цялата колона, вместо клетка по клетка.
+        """
+        if not XLSXWRITER_AVAILABLE:
+            self._write_dataframe_openpyxl(df, file_path, sheet_name, column_formats)
+            return
+
+        # pandas записва клетките колона по колона, затова constant_memory
+        # (изисква запис ред по ред) не може да се ползва през ExcelWriter.
+        options = {'strings_to_formulas': False, 'strings_to_urls': False}
+        with pd.ExcelWriter(file_path, engine='xlsxwriter', engine_kwargs={'options': options}) as writer:
+            df.to_excel(writer, sheet_name=sheet_name, index=False, header=False, startrow=1)
+            worksheet = writer.sheets[sheet_name]
+
+            # Форматите се създават веднъж и се прилагат за целия ред/колона
+            header_format = writer.book.add_format(self._xlsxwriter_properties(_EXCEL_STYLES['routes_header']))
+            headers = [str(column) for column in df.columns]
+            worksheet.write_row(0, 0, headers, header_format)
+
+            number_formats = {}
+            for col_idx, column in enumerate(df.columns):
+                max_length = len(headers[col_idx])
+                if len(df):
+                    max_length = max(max_length, int(df[column].astype(str).str.len().max()))
+
+                num_format = (column_formats or {}).get(column)
+                column_format = None
+                if num_format:
+                    if num_format not in number_formats:
+                        number_formats[num_format] = writer.book.add_format({'num_format': num_format})
+                    column_format = number_formats[num_format]
+                worksheet.set_column(col_idx, col_idx, min(max_length + 2, 50), column_format)
+
     def export_warehouse_orders(self, warehouse_customers: List[Customer]) -> str:
         """Експортира заявките в склада (за съвместимост)"""
         if not warehouse_customers:
@@ -2911,19 +3605,29 @@ class ExcelExporter:
         file_path = _append_run_date_to_filename(file_path, self.run_date)
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
-        data = []
-        for customer in warehouse_customers:
-            data.append({
-                'ID': customer.id,
-                'Име': customer.name,
-                'Обем (ст.)': customer.volume,
-                'GPS координати': customer.original_gps_data,
-                'Latitude': customer.coordinates[0] if customer.coordinates else '',
-                'Longitude': customer.coordinates[1] if customer.coordinates else ''
-            })
+        headers = ['ID', 'Име', 'Обем (ст.)', 'GPS координати', 'Latitude', 'Longitude']
+        column_formats = {
+            'Обем (ст.)': '0.00',
+            'Latitude': '0.000000',
+            'Longitude': '0.000000',
+        }
+        rows = (
+            [
+                customer.id,
+                customer.name,
+                customer.volume,
+                customer.original_gps_data,
+                customer.coordinates[0] if customer.coordinates else '',
+                customer.coordinates[1] if customer.coordinates else ''
+            ]
+            for customer in warehouse_customers
+        )
         
-        df = pd.DataFrame(data)
-        df.to_excel(file_path, index=False)
+        if XLSXWRITER_AVAILABLE:
+            self._write_rows_xlsxwriter(rows, headers, file_path, column_formats=column_formats)
+        else:
+            df = pd.DataFrame(list(rows), columns=headers)
+            self._write_dataframe_excel(df, file_path, column_formats=column_formats)
         
         logger.info(f"Складови заявки експортирани в {file_path}")
         return file_path
@@ -2936,7 +3640,7 @@ class ExcelExporter:
         
         data = []
         for i, route in enumerate(solution.routes):
-            vehicle_name = VEHICLE_SETTINGS.get(route.vehicle_type.value, {}).get('name', 'Неизвестен')
+            vehicle_name = self._vehicle_name_by_type.get(route.vehicle_type.value, 'Неизвестен')
             previous_stop_name = "Депо"
             for j, customer in enumerate(route.customers):
                 data.append({
@@ -2953,79 +3657,24 @@ class ExcelExporter:
                 previous_stop_name = customer.name
         
         df = pd.DataFrame(data)
-        df.to_excel(file_path, index=False, engine='openpyxl')
+        self._write_dataframe_excel(df, file_path, column_formats={'Обем (ст.)': '0.00'})
         
         logger.info(f"Маршрути експортирани в {file_path}")
         return file_path
 
     def export_routes_csv(self, solution: CVRPSolution) -> str:
         """Експортира маршрутите като CSV файл (разделен по запетаи)"""
-        import csv
         
         file_path = _normalize_output_file_path(self.config.csv_output_file, "routes.csv")
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
-        headers = [
-            'Маршрут', 'Превозно средство', 'Ред в маршрута',
-            'Посока на движение', 'ID клиент', 'Име клиент', 'Номер поръчка', 'Обем (ст.)', 'GPS координати',
-            'Разстояние до центъра (км)', 'Депо стартова точка',
-            'Разстояние от предишен (км)', 'Накоплено разстояние (км)',
-            'Време от предишен (мин)', 'Накоплено време (мин)',
-            'Стартово време (мин)', 'Време с натрупване (мин)', 'Време с натрупване (чч:мм)'
-        ]
-        
-        center_location = get_config().locations.center_location
+        self._load_vehicle_configs()
         
+        # Редовете се генерират и записват поточно - същите като в Excel sheet-а
         with open(file_path, 'w', newline='', encoding='utf-8-sig') as f:
             writer = csv.writer(f, delimiter=',')
-            writer.writerow(headers)
-            
-            for i, route in enumerate(solution.routes):
-                vehicle_name = VEHICLE_SETTINGS.get(route.vehicle_type.value, {}).get('name', 'Неизвестен')
-                start_time_minutes = self._get_start_time_for_vehicle(route.vehicle_type)
-                vehicle_config = self._get_vehicle_config(route.vehicle_type)
-                service_time_minutes = vehicle_config.service_time_minutes if vehicle_config else 15
-                
-                cumulative_distance = 0
-                cumulative_time = 0
-                previous_customer_coords = route.depot_location
-                previous_stop_name = "Депо"
-                
-                for j, customer in enumerate(route.customers):
-                    distance_to_center = self._calculate_distance_to_center(
-                        customer.coordinates, center_location) if customer.coordinates else 0.0
-                    distance_from_previous = self._calculate_distance_between_points(
-                        previous_customer_coords, customer.coordinates) if customer.coordinates else 0.0
-                    cumulative_distance += distance_from_previous
-                    time_from_previous = self._calculate_time_between_points(
-                        previous_customer_coords, customer.coordinates) if customer.coordinates else 0.0
-                    total_time_for_this_step = time_from_previous + service_time_minutes
-                    cumulative_time += total_time_for_this_step
-                    total_time_with_start = start_time_minutes + cumulative_time
-                    
-                    row = [
-                        i + 1,
-                        vehicle_name,
-                        j + 1,
-                        self._format_movement_direction(previous_stop_name, customer.name),
-                        customer.id,
-                        customer.name,
-                        customer.document,
-                        customer.volume,
-                        customer.original_gps_data,
-                        round(distance_to_center, 2),
-                        f"{route.depot_location[0]:.6f}, {route.depot_location[1]:.6f}",
-                        round(distance_from_previous, 2),
-                        round(cumulative_distance, 2),
-                        round(total_time_for_this_step, 1),
-                        round(cumulative_time, 1),
-                        start_time_minutes,
-                        round(total_time_with_start, 1),
-                        self._format_time_hh_mm(int(total_time_with_start))
-                    ]
-                    writer.writerow(row)
-                    previous_customer_coords = customer.coordinates
-                    previous_stop_name = customer.name
+            writer.writerow(_ROUTES_HEADERS)
+            writer.writerows(self._iter_route_rows(solution))
         
         logger.info(f"CSV маршрути експортирани в {file_path}")
         return file_path
@@ -3255,6 +3904,9 @@ class OutputHandler:
     def __init__(self, config: Optional[OutputConfig] = None):
         self.config = config or get_config().output
         self.excel_exporter = ExcelExporter(self.config)
+        # Рендериран HTML на картите от последното генериране (ключовете съвпадат с output_files),
+        # за директно вграждане (напр. във Flask/Django) без повторно четене или рендериране
+        self.pre_rendered: Dict[str, str] = {}
     
     def generate_all_outputs(self, solution: CVRPSolution, 
                            warehouse_allocation: WarehouseAllocation,
@@ -3262,13 +3914,31 @@ class OutputHandler:
         """Генерира всички изходни файлове и връща речник с пътищата до тях"""
         logger.info("Започвам генериране на изходни файлове")
         output_files = {}
+        self.pre_rendered = {}
 
         # 1. Интерактивна карта (обща)
         if self.config.enable_interactive_map:
             map_gen = InteractiveMapGenerator(self.config)
-            route_map = map_gen.create_map(solution, warehouse_allocation, depot_location)
-            map_file = map_gen.save_map(route_map)
+            cache_file = None
+            if self.config.cache_rendered_map:
+                cache_file = self._map_cache_file(solution, warehouse_allocation, depot_location,
+                                                  map_gen.use_routing)
+            
+            if cache_file and os.path.exists(cache_file):
+                # Същото решение вече е рендерирано - пропускаме създаването и рендерирането на картата
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    map_html = f.read()
+                map_file = map_gen.write_map_html(map_html)
+                logger.info(f"Използвана кеширана карта: {cache_file}")
+            else:
+                route_map = map_gen.create_map(solution, warehouse_allocation, depot_location)
+                map_file = map_gen.save_map(route_map)
+                map_html = map_gen.render_map_html(route_map)
+                if cache_file:
+                    shutil.copy(map_file, cache_file)
+                    self._prune_map_cache(cache_file)
             output_files['map'] = map_file
+            self.pre_rendered['map'] = map_html
 
             # 1.1. Отделни HTML карти за всеки маршрут
             routes_dir = self.config.routes_output_dir
@@ -3279,6 +3949,7 @@ class OutputHandler:
                 route_file = os.path.join(routes_dir, f"route_{route_number}.html")
                 saved_route_file = map_gen.save_map(single_map, route_file)
                 output_files[f'route_map_{route_number}'] = saved_route_file
+                self.pre_rendered[f'route_map_{route_number}'] = map_gen.render_map_html(single_map)
             logger.info(f"Генерирани {len(solution.routes)} отделни HTML карти в {routes_dir}")
         
         # 2. Обединяване на всички необслужени клиенти
@@ -3307,6 +3978,49 @@ class OutputHandler:
         logger.info(f"Генерирани {len(output_files)} изходни файла")
         return output_files
 
+    def _map_cache_file(self, solution: CVRPSolution, warehouse_allocation: WarehouseAllocation,
+                        depot_location: Tuple[float, float], use_routing: bool) -> str:
+        """Връща пътя на кешираната карта за даденото решение.
+        Ключът е blake2b хеш на депото, маршрутите (тип автобус, депо, totals и клиенти по ред),
+        клиентите за склада и настройките, които влияят на картата. За всеки клиент се хешира
+        всичко, което картата показва (координати, обем, име, документ), а не само id-то -
+        иначе преместен или преименуван клиент със същото id би върнал стара карта.
+        Наличността на routing engine също е част от ключа, за да не се преизползва карта с прави линии.
+        """
+        def customer_key(customer: Customer) -> tuple:
+            return (customer.id, customer.coordinates, customer.volume, customer.name, customer.document)
+        
+        main_config = get_config()
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((
+            tuple(depot_location),
+            [(route.vehicle_type.value, route.vehicle_id, route.depot_location,
+              route.total_distance_km, route.total_time_minutes, route.total_volume,
+              [customer_key(customer) for customer in route.customers])
+             for route in solution.routes],
+            [customer_key(customer) for customer in warehouse_allocation.warehouse_customers],
+            self.config,
+            main_config.locations,
+            main_config.routing.engine.value,
+            use_routing,
+        )).encode("utf-8"))
+        
+        map_file = _normalize_output_file_path(self.config.map_output_file, "interactive_map.html")
+        stem, _ = os.path.splitext(map_file)
+        return f"{stem}.{digest.hexdigest()}.html"
+
+    @staticmethod
+    def _prune_map_cache(keep_file: str) -> None:
+        """Изтрива по-старите кеширани карти (<име>.<хеш>.html), за да не се трупат пълни HTML копия"""
+        stem = keep_file[:-len(".html")].rsplit(".", 1)[0]
+        for cached in glob.glob(f"{glob.escape(stem)}.*.html"):
+            cache_hash = cached[len(stem) + 1:-len(".html")]
+            if re.fullmatch(r"[0-9a-f]{32}", cache_hash) and os.path.abspath(cached) != os.path.abspath(keep_file):
+                try:
+                    os.remove(cached)
+                except OSError as e:
+                    logger.warning(f"Неуспешно изтриване на стара кеширана карта {cached}: {e}")
+
 
 # Удобна функция
 def generate_outputs(solution: CVRPSolution, warehouse_allocation: WarehouseAllocation,
@@ -9,14 +9,16 @@ PyVRP е специализирана библиотека за VRP оптими
 
 """
 
+import hashlib
 import logging
 import math
-from typing import List, Dict, Tuple, Optional
+import numpy as np
+from typing import Callable, List, Dict, Tuple, Optional
 from dataclasses import dataclass
 
 try:
     import pyvrp
-    from pyvrp import Model, solve, SolveParams, constants
+    from pyvrp import Model, ProblemData, solve, SolveParams, constants
     from pyvrp.stop import MaxRuntime
     PYVRP_AVAILABLE = True
 except ImportError:
@@ -26,6 +28,7 @@ except ImportError:
 from config import (
     CVRPConfig,
     VehicleConfig,
+    VehicleType as ConfigVehicleType,
     LocationConfig,
     calculate_customer_drop_penalties,
     is_location_in_center_zone,
@@ -33,12 +36,57 @@ from config import (
 from input_handler import Customer
 from osrm_client import DistanceMatrix
 from warehouse_manager import WarehouseAllocation
-from cvrp_solver import Route, CVRPSolution, calculate_distance_km
+from cvrp_solver import Route, CVRPSolution, haversine_km_batch
+from numba_helpers import njit, prange, NUMBA_AVAILABLE
 
 
 logger = logging.getLogger(__name__)
 
 
+@njit(cache=True, parallel=True)
+def _build_center_distance_matrices(base, is_center_loc, center_discount, center_penalty,
+                                    apply_priority, apply_restrictions):
+    """
+    Изчислява матриците за разстояние на CENTER_BUS и на останалите бусове с едно
+    паралелно обхождане на базовата матрица (всяка клетка се чете веднъж).
+    """
+    n = base.shape[0]
+    center_bus = np.empty((n, n), dtype=np.int64)
+    other_bus = np.empty((n, n), dtype=np.int64)
+    for i in prange(n):
+        for j in range(n):
+            if i == j:
+                # Разстоянието от локация до самата нея е 0
+                center_bus[i, j] = 0
+                other_bus[i, j] = 0
+                continue
+            distance = base[i, j]
+            if is_center_loc[j]:
+                center_bus[i, j] = np.int64(distance * center_discount) if apply_priority else distance
+                other_bus[i, j] = distance + center_penalty if apply_restrictions else distance
+            else:
+                center_bus[i, j] = distance + center_penalty if apply_priority else distance
+                other_bus[i, j] = distance
+    return center_bus, other_bus
+
+
+@njit(cache=True)
+def _route_distance_time(distances, durations, in_city, route_idx, traffic_multiplier, apply_traffic):
+    """Сумира разстоянието и времето за пътуване по поредица от индекси в матрицата"""
+    total_distance = 0.0
+    total_time = 0.0
+    for k in range(route_idx.shape[0] - 1):
+        i = route_idx[k]
+        j = route_idx[k + 1]
+        total_distance += distances[i, j]
+        travel_time = durations[i, j]
+        # Корекция за трафик, ако и двете точки на отсечката са в града
+        if apply_traffic and in_city[i] and in_city[j]:
+            travel_time = travel_time * traffic_multiplier
+        total_time += travel_time
+    return total_distance, total_time
+
+
 class PyVRPSolver:
     """
     PyVRP CVRP решател - адаптер за OR-Tools интерфейс.
@@ -55,6 +103,11 @@ class PyVRPSolver:
         location_config: Географски настройки
     """
 
+    # Кеш на готовите (Model, ProblemData) по хеш на входните данни - при повторно
+    # решаване на същата задача моделът не се създава отново
+    _model_cache: Dict[bytes, Tuple["Model", "ProblemData"]] = {}
+    _MODEL_CACHE_SIZE = 4
+
     def __init__(
         self,
         config: CVRPConfig,
@@ -85,6 +138,129 @@ class PyVRPSolver:
         self.center_zone_customers = center_zone_customers or []
         self.location_config = location_config
 
+        # Активните превозни средства и конфигурацията по тип - фиксирани за живота на решателя
+        self._enabled_vehicles = [v for v in self.vehicle_configs if v.enabled]
+        self._vehicle_config_by_type: Dict[str, VehicleConfig] = {}
+        for v_config in self._enabled_vehicles:
+            # Първата конфигурация за всеки тип (както при линейното търсене)
+            self._vehicle_config_by_type.setdefault(v_config.vehicle_type.value, v_config)
+        # Индекс на всяко депо в матрицата (първото срещане)
+        self._depot_index: Dict[Tuple[float, float], int] = {}
+        for i, depot in enumerate(self.unique_depots):
+            self._depot_index.setdefault(tuple(depot), i)
+
+        # Индекс в матрицата за всеки клиент (депата са първи) - O(1) вместо customers.index()
+        self._customer_matrix_idx: Dict[str, int] = {}
+        for i, customer in enumerate(self.customers):
+            self._customer_matrix_idx.setdefault(customer.id, len(self.unique_depots) + i)
+        # ID-тата на всички клиенти - начално множество на пропуснатите при извличане на решение
+        self._customer_ids = frozenset(self._customer_matrix_idx)
+        # Обемите на клиентите по индекс - за векторно сумиране на обема на маршрут
+        self._volumes = np.array(
+            [customer.volume if hasattr(customer, 'volume') and customer.volume else 0 for customer in self.customers],
+            dtype=np.float64,
+        )
+        # Матриците като NumPy масиви за векторно сумиране по маршрут
+        self._distances_m = np.asarray(self.distance_matrix.distances, dtype=np.float64)
+        self._durations_s = np.asarray(self.distance_matrix.durations, dtype=np.float64)
+        # Целочислени (int64, C-contiguous) матрици за депата + клиентите, както ги очаква PyVRP.
+        # Преобразуват се веднъж, а не при всяко създаване на модел.
+        num_locations = len(self.unique_depots) + len(self.customers)
+        self._distances_int = np.ascontiguousarray(self._distances_m[:num_locations, :num_locations].astype(np.int64))
+        self._durations_int = np.ascontiguousarray(self._durations_s[:num_locations, :num_locations].astype(np.int64))
+
+        # Настройки за градски трафик - фиксирани за целия живот на решателя
+        self._enable_traffic = False
+        self._traffic_multiplier = 1.0
+        self._city_center = None
+        self._city_radius = 0
+        if self.location_config:
+            self._enable_traffic = getattr(self.location_config, 'enable_city_traffic_adjustment', False)
+            self._traffic_multiplier = getattr(self.location_config, 'city_traffic_duration_multiplier', 1.0)
+            self._city_center = getattr(self.location_config, 'city_center_coords', None)
+            self._city_radius = getattr(self.location_config, 'city_traffic_radius_km', 12.0)
+        # Кои локации (депа + клиенти) са в градската зона - изчислява се веднъж
+        self._in_city = self._locations_in_city()
+        # Времената с корекция за градски трафик (int64) - обща основа за всички профили
+        self._durations_traffic_int = self._traffic_adjusted_durations()
+
+    @staticmethod
+    def _profile_distance_transforms(
+        center_discount: float,
+        center_penalty: int,
+        center_priority_enabled: bool,
+        center_restrictions_enabled: bool,
+    ) -> Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]]:
+        """
+        Създава трансформациите на базовата матрица за разстояние за всеки вид профил.
+        Настройките се фиксират в closure-ите при създаването на модела, така че
+        всяка трансформация е без разклонения. Всяка заделя само една N² матрица -
+        отстъпката/глобата се прилага на място само върху колоните на клиентите в центъра.
+
+        Args:
+            center_discount: Отстъпка за CENTER_BUS към клиенти в центъра
+            center_penalty: Глоба за влизане/излизане от центъра
+            center_priority_enabled: Дали CENTER_BUS има приоритет за центъра
+            center_restrictions_enabled: Дали останалите бусове се глобяват за центъра
+
+        Returns:
+            Речник вид профил ('center' / 'other') -> функция (base, is_center_loc) -> матрица
+        """
+        def center_bus_distance(base: np.ndarray, is_center_loc: np.ndarray) -> np.ndarray:
+            # Глоба извън центъра, отстъпка за колоните на клиентите в центъра
+            distance = base + center_penalty
+            distance[:, is_center_loc] = (base[:, is_center_loc] * center_discount).astype(np.int64)
+            return distance
+
+        def other_bus_distance(base: np.ndarray, is_center_loc: np.ndarray) -> np.ndarray:
+            # Глоба само за колоните на клиентите в центъра
+            distance = base.copy()
+            distance[:, is_center_loc] += center_penalty
+            return distance
+
+        def unchanged_distance(base: np.ndarray, is_center_loc: np.ndarray) -> np.ndarray:
+            return base.copy()
+
+        return {
+            'center': center_bus_distance if center_priority_enabled else unchanged_distance,
+            'other': other_bus_distance if center_restrictions_enabled else unchanged_distance,
+        }
+
+    def _traffic_adjusted_durations(self) -> np.ndarray:
+        """
+        Прилага множителя за градски трафик веднъж към целочислената матрица за време.
+        Засягат се само отсечките, при които и двете точки са в града.
+
+        Returns:
+            int64 матрица за време (същият масив, ако корекцията е изключена)
+        """
+        if not (self._enable_traffic and self._city_center) or not self._in_city.any():
+            return self._durations_int
+
+        city_mask = self._in_city[:, None] & self._in_city[None, :]
+        np.fill_diagonal(city_mask, False)
+        adjusted = self._durations_int.copy()
+        adjusted[city_mask] = (adjusted[city_mask] * self._traffic_multiplier).astype(np.int64)
+        return adjusted
+
+    def _locations_in_city(self) -> np.ndarray:
+        """
+        Определя векторно кои локации (депа, после клиенти) са в градската зона.
+
+        Returns:
+            Булев масив с дължина броя локации
+        """
+        num_locations = len(self.unique_depots) + len(self.customers)
+        if not (self._enable_traffic and self._city_center):
+            return np.zeros(num_locations, dtype=bool)
+
+        coords = np.array(
+            list(self.unique_depots) + [customer.coordinates or (0, 0) for customer in self.customers],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+        dist_to_city_center = haversine_km_batch(coords[:, 0], coords[:, 1], *self._city_center)
+        return dist_to_city_center <= self._city_radius
+
     def solve(self) -> CVRPSolution:
         """
         Решава CVRP проблема използвайки PyVRP.
@@ -97,25 +273,22 @@ class PyVRPSolver:
             return self._create_empty_solution()
 
         try:
-            # 1. Създаване на PyVRP модел
-            model = self._create_pyvrp_model()
+            # 1. Създаване на PyVRP модел и ProblemData с готовите матрици (или от кеша)
+            model, problem_data = self._get_pyvrp_model()
             
             logger.info(f"PyVRP model created successfully")
             logger.info(f"  - Depots: {len(model.depots)}")
             logger.info(f"  - Clients: {len(model.clients)}")
             logger.info(f"  - Vehicle types: {len(model.vehicle_types)}")
 
-            # 2. Получаваме ProblemData от модела
-            problem_data = model.data()
-
-            # 3. Решаване
+            # 2. Решаване
             logger.info(f"Solving with PyVRP (time limit: {self.config.time_limit_seconds}s)...")
             
             # Използваме MaxRuntime като stop критерий
             stop_criterion = MaxRuntime(self.config.time_limit_seconds)
             result = solve(problem_data, stop=stop_criterion, seed=42)
 
-            # 4. Обработка на решението
+            # 3. Обработка на решението
             logger.info(f"PyVRP solution found")
             logger.info(f"  - Cost: {result.cost()}")
             logger.info(f"  - Feasible: {result.is_feasible()}")
@@ -126,15 +299,46 @@ class PyVRPSolver:
             logger.error(f"Error in PyVRP solver: {e}", exc_info=True)
             return self._create_empty_solution()
 
-    def _create_pyvrp_model(self) -> Model:
+    def _model_cache_key(self) -> bytes:
+        """Хеш на всички входни данни, от които зависи PyVRP моделът"""
+        digest = hashlib.blake2b(digest_size=32)
+        digest.update(repr((
+            self.unique_depots,
+            [(c.id, c.volume, c.coordinates) for c in self.customers],
+            [c.id for c in self.center_zone_customers],
+            self.vehicle_configs,
+            self.location_config,
+            self.config,
+        )).encode("utf-8"))
+        digest.update(self._distances_int.tobytes())
+        digest.update(self._durations_int.tobytes())
+        return digest.digest()
+
+    def _get_pyvrp_model(self) -> Tuple[Model, ProblemData]:
+        """Връща кеширания модел за същите входни данни или създава нов"""
+        cache = PyVRPSolver._model_cache
+        key = self._model_cache_key()
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info("Using cached PyVRP model")
+            return cached
+
+        cached = self._create_pyvrp_model()
+        if len(cache) >= self._MODEL_CACHE_SIZE:
+            # Премахваме най-стария запис
+            cache.pop(next(iter(cache)))
+        cache[key] = cached
+        return cached
+
+    def _create_pyvrp_model(self) -> Tuple[Model, ProblemData]:
         """
         Създава PyVRP модел от нашите структури.
+        Матриците за разстояние/време на всеки профил се изчисляват с NumPy и се подават
+        директно на ProblemData, вместо да се добавят N² edges през model.add_edge.
 
         Returns:
-            PyVRP Model инстанция
+            Кортеж (PyVRP Model, ProblemData с матриците по профили)
         """
-        from config import VehicleType as ConfigVehicleType
-        
         model = Model()
         
         # Всички локации (депа + клиенти) в списък за лесен достъп
@@ -148,7 +352,7 @@ class PyVRPSolver:
             # Model.add_depot приема параметри директно, връща Depot обект
             depot = model.add_depot(x=lon, y=lat, name=f"Depot_{i}")
             depot_objects.append(depot)
-            depot_to_obj[(lat, lon)] = depot
+            depot_to_obj[self._depot_key(lat, lon)] = depot
             all_locations.append(depot)
             logger.info(f"  - Depot {i}: ({lat}, {lon})")
 
@@ -177,11 +381,15 @@ class PyVRPSolver:
         )
 
         # 3. Добавяме клиенти
-        enabled_vehicles = [v for v in self.vehicle_configs if v.enabled]
+        enabled_vehicles = self._enabled_vehicles
         service_duration_s = 0  # Добавя се vehicle-specific в edge durations.
         
         client_objects = []  # За референция към client обекти
-        client_in_center = []  # Булев списък дали клиентът е в центъра
+        # Дали локацията е клиент в център зоната - по една стойност за всяка локация,
+        # депата (първите позиции) винаги са False
+        num_depots = len(depot_objects)
+        is_center_loc = np.zeros(num_depots + len(self.customers), dtype=bool)
+        is_center_loc[num_depots:] = [customer.id in center_zone_customer_ids for customer in self.customers]
         
         # Определяме дали да позволим пропускане на клиенти
         # Prize е "наградата" за обслужване - колкото по-висока, толкова по-малко вероятно е да се пропусне
@@ -205,10 +413,6 @@ class PyVRPSolver:
             # Определяме delivery (обем на клиента)
             delivery = int(customer.volume * 100) if hasattr(customer, 'volume') and customer.volume else 1
             
-            # Проверяваме дали клиентът е в център зоната
-            is_in_center = customer.id in center_zone_customer_ids
-            client_in_center.append(is_in_center)
-            
             # Prize пропорционална на обема - по-големи клиенти са по-важни
             # Ако allow_dropping=False, клиентите са required=True
             client_prize = int(drop_penalties[idx]) if allow_dropping else 0
@@ -226,7 +430,11 @@ class PyVRPSolver:
             )
             client_objects.append(client)
             all_locations.append(client)
-            logger.debug(f"  - Client {idx}: ID={customer.id}, volume={delivery}, center={is_in_center}, prize={client_prize}")
+            # Ленивото форматиране не строи низа за всеки клиент, когато DEBUG е изключен
+            logger.debug(
+                "  - Client %d: ID=%s, volume=%d, center=%s, prize=%s",
+                idx, customer.id, delivery, is_center_loc[num_depots + idx], client_prize,
+            )
 
         # 4. Създаваме профил за всеки тип бус, за да има точен service time.
         center_discount = (
@@ -259,24 +467,17 @@ class PyVRPSolver:
                 f"Added profile for {v_key}: service time {v_config.service_time_minutes} мин/клиент"
             )
 
-        # 5. Добавяме edges за всички профили
+        # 5. Матрици за разстояние/време за всички профили
         num_locations = len(all_locations)
-        num_depots = len(depot_objects)
-        logger.info(f"Adding edges with center zone logic...")
+        logger.info(f"Building edge matrices with center zone logic...")
         logger.info(f"  - Center discount for CENTER_BUS: {center_discount}")
         logger.info(f"  - Center penalty for other buses: {center_penalty}")
         
         # Настройки за градски трафик
-        enable_traffic = False
-        traffic_multiplier = 1.0
-        city_center = None
-        city_radius = 0
-        
-        if self.location_config:
-            enable_traffic = getattr(self.location_config, 'enable_city_traffic_adjustment', False)
-            traffic_multiplier = getattr(self.location_config, 'city_traffic_duration_multiplier', 1.0)
-            city_center = getattr(self.location_config, 'city_center_coords', None)
-            city_radius = getattr(self.location_config, 'city_traffic_radius_km', 12.0)
+        enable_traffic = self._enable_traffic
+        traffic_multiplier = self._traffic_multiplier
+        city_center = self._city_center
+        city_radius = self._city_radius
         
         if enable_traffic and city_center:
             logger.info(f"City traffic adjustment ENABLED:")
@@ -284,85 +485,82 @@ class PyVRPSolver:
             logger.info(f"  - City radius: {city_radius} km")
             logger.info(f"  - Duration multiplier: {traffic_multiplier} (+{(traffic_multiplier-1)*100:.0f}%)")
         
-        # Предварително определяме кои локации са в градската зона
-        locations_in_city = []
-        for loc_idx in range(num_locations):
-            if loc_idx < num_depots:
-                # Депо
-                lat, lon = self.unique_depots[loc_idx]
-            else:
-                # Клиент
-                client_idx = loc_idx - num_depots
-                if client_idx < len(self.customers):
-                    lat, lon = self.customers[client_idx].coordinates or (0, 0)
-                else:
-                    lat, lon = 0, 0
-            
-            # Проверяваме дали е в градската зона
-            in_city = False
-            if enable_traffic and city_center:
-                dist_to_city_center = calculate_distance_km((lat, lon), city_center)
-                in_city = dist_to_city_center <= city_radius
-            locations_in_city.append(in_city)
+        # Базови разстояния от OSRM матрицата (int64, преобразувани в __init__)
+        base_distance = self._distances_int
+        
+        # Кои корекции реално променят матриците - в останалите случаи профилите
+        # споделят готова матрица без междинни масиви за всяка двойка (i, j)
+        need_traffic = bool(enable_traffic and city_center)
+        need_center = center_priority_enabled or (center_restrictions_enabled and bool(center_zone_customer_ids))
         
+        # Времената вече са с множителя за градски трафик (изчислени в __init__)
+        in_city = self._in_city
+        duration = self._durations_traffic_int
         city_edges_count = 0
-        for i in range(num_locations):
-            for j in range(num_locations):
-                if i == j:
-                    continue
-                
-                # Базово разстояние и време от OSRM матрицата
-                base_distance = int(self.distance_matrix.distances[i][j])
-                duration = int(self.distance_matrix.durations[i][j])
-                
-                # Прилагаме множител за градски трафик ако и двете точки са в града
-                if enable_traffic and locations_in_city[i] and locations_in_city[j]:
-                    duration = int(duration * traffic_multiplier)
-                    city_edges_count += 1
-                
-                # Проверяваме дали destination е клиент в центъра
-                is_dest_center_client = False
-                if j >= num_depots:
-                    client_idx = j - num_depots
-                    if client_idx < len(client_in_center):
-                        is_dest_center_client = client_in_center[client_idx]
-                
-                # Базов edge (без профил) - без service time.
-                model.add_edge(
-                    frm=all_locations[i],
-                    to=all_locations[j],
-                    distance=base_distance,
-                    duration=duration
-                )
+        if need_traffic:
+            # Отсечки между две различни локации в града
+            locations_in_city_count = int(in_city.sum())
+            city_edges_count = locations_in_city_count * (locations_in_city_count - 1)
+        
+        if need_center:
+            distance_transforms = self._profile_distance_transforms(
+                center_discount,
+                int(center_penalty),
+                center_priority_enabled,
+                center_restrictions_enabled,
+            )
+        else:
+            # Без център зона всички профили използват базовите разстояния
+            shared_distance = base_distance.copy()
+            np.fill_diagonal(shared_distance, 0)
+        is_client_row = (np.arange(num_locations) >= num_depots)[:, None]
+        
+        # Профилите се подават в реда на добавяне (индексът на профила в ProblemData)
+        distance_matrices = []
+        duration_matrices = []
+        duration_by_service_time = {}  # Профили с еднакъв service time споделят матрицата за време
+        # Матрицата за всеки вид профил (CENTER_BUS / останалите) се изчислява най-много веднъж
+        distance_by_kind = {}
+        profile_kinds = {
+            'center' if v_config.vehicle_type == ConfigVehicleType.CENTER_BUS else 'other'
+            for v_config in profile_vehicle_configs.values()
+        }
+        if need_center and NUMBA_AVAILABLE and len(profile_kinds) == 2:
+            # Двете матрици са нужни - изчисляват се в един паралелен проход
+            distance_by_kind['center'], distance_by_kind['other'] = _build_center_distance_matrices(
+                base_distance,
+                is_center_loc,
+                float(center_discount),
+                int(center_penalty),
+                center_priority_enabled,
+                center_restrictions_enabled,
+            )
+        for v_key, v_config in profile_vehicle_configs.items():
+            # Service time се добавя към времето на edges, излизащи от клиент
+            service_time_s = vehicle_service_times.get(v_key, 15 * 60)
+            vehicle_duration = duration_by_service_time.get(service_time_s)
+            if vehicle_duration is None:
+                vehicle_duration = duration + np.where(is_client_row, service_time_s, 0)
+                # Времето от локация до самата нея е 0
+                np.fill_diagonal(vehicle_duration, 0)
+                duration_by_service_time[service_time_s] = vehicle_duration
+
+            if not need_center:
+                vehicle_distance = shared_distance
+            else:
+                kind = 'center' if v_config.vehicle_type == ConfigVehicleType.CENTER_BUS else 'other'
+                vehicle_distance = distance_by_kind.get(kind)
+                if vehicle_distance is None:
+                    vehicle_distance = distance_transforms[kind](base_distance, is_center_loc)
+                    # Разстоянието от локация до самата нея е 0
+                    np.fill_diagonal(vehicle_distance, 0)
+                    distance_by_kind[kind] = vehicle_distance
 
-                for v_key, v_config in profile_vehicle_configs.items():
-                    vehicle_duration = duration
-                    if i >= num_depots:
-                        vehicle_duration += vehicle_service_times.get(v_key, 15 * 60)
-
-                    if v_config.vehicle_type == ConfigVehicleType.CENTER_BUS:
-                        if is_dest_center_client and center_priority_enabled:
-                            vehicle_distance = int(base_distance * center_discount)
-                        elif center_priority_enabled:
-                            vehicle_distance = base_distance + int(center_penalty)
-                        else:
-                            vehicle_distance = base_distance
-                    else:
-                        if is_dest_center_client and center_restrictions_enabled:
-                            vehicle_distance = base_distance + int(center_penalty)
-                        else:
-                            vehicle_distance = base_distance
-
-                    model.add_edge(
-                        frm=all_locations[i],
-                        to=all_locations[j],
-                        distance=vehicle_distance,
-                        duration=vehicle_duration,
-                        profile=vehicle_profiles[v_key]
-                    )
+            distance_matrices.append(vehicle_distance)
+            duration_matrices.append(vehicle_duration)
 
         if enable_traffic:
-            locations_in_city_count = sum(locations_in_city)
+            locations_in_city_count = int(in_city.sum())
             logger.info(f"City traffic adjustment applied:")
             logger.info(f"  - Locations in city: {locations_in_city_count}/{num_locations}")
             logger.info(f"  - Edges with traffic multiplier: {city_edges_count}")
@@ -376,17 +574,8 @@ class PyVRPSolver:
             # Определяме депо за този тип превозно средство
             start_depot = None
             if v_config.start_location:
-                # Търсим депото по координати
-                if v_config.start_location in depot_to_obj:
-                    start_depot = depot_to_obj[v_config.start_location]
-                else:
-                    # Може да има малки разлики във float стойностите
-                    # Търсим най-близкото депо
-                    for depot_coords, depot_obj in depot_to_obj.items():
-                        if (abs(depot_coords[0] - v_config.start_location[0]) < 0.0001 and 
-                            abs(depot_coords[1] - v_config.start_location[1]) < 0.0001):
-                            start_depot = depot_obj
-                            break
+                # Търсим депото по закръглените координати (поглъща малките float разлики)
+                start_depot = depot_to_obj.get(self._depot_key(*v_config.start_location))
             
             if start_depot is None:
                 start_depot = depot_objects[0] if depot_objects else None
@@ -433,9 +622,25 @@ class PyVRPSolver:
         logger.info(f"  - Vehicle types: {len(model.vehicle_types)}")
         logger.info(f"  - Center zone customers: {len(center_zone_customer_ids)}")
 
-        return model
+        # Моделът няма edges - ProblemData се създава с едно извикване директно от
+        # матриците на профилите (без model.data(), който запълва и копира N² базови матрици)
+        problem_data = ProblemData(
+            clients=model.clients,
+            depots=model.depots,
+            vehicle_types=model.vehicle_types,
+            distance_matrices=distance_matrices,
+            duration_matrices=duration_matrices,
+            groups=model.groups,
+        )
+
+        return model, problem_data
 
 
+    @staticmethod
+    def _depot_key(lat: float, lon: float) -> Tuple[float, float]:
+        """Ключ за търсене на депо - координатите, закръглени до 4 знака (~10 м)"""
+        return (round(lat, 4), round(lon, 4))
+
     def _extract_solution(self, model: Model, problem_data, result) -> CVRPSolution:
         """
         Преобразува PyVRP решение в нашия CVRPSolution формат.
@@ -449,7 +654,7 @@ class PyVRPSolver:
             CVRPSolution
         """
         routes_list = []
-        dropped_customers = set(c.id for c in self.customers)
+        dropped_customers = set(self._customer_ids)
         total_distance_km = 0.0
         total_time_minutes = 0.0
         total_volume = 0.0
@@ -460,13 +665,16 @@ class PyVRPSolver:
         
         # Вземаме списъка с vehicle types за да можем да ги индексираме
         vehicle_types_list = problem_data.vehicle_types()
+        num_depots = len(model.depots)
+        num_customers = len(self.customers)
+        # Индекс на vehicle type в модела -> наш VehicleType (изчислява се веднъж, не за всеки маршрут)
+        vehicle_type_by_index = self._vehicle_types_by_index(vehicle_types_list)
+        default_vehicle_type = self._default_vehicle_type()
 
         # Iteriraem prez vseki marshut v resheniyeto
         for route in result.best.routes():
-            route_customers = []
             route_distance_m = 0.0
             route_time_s = 0.0
-            route_volume = 0.0
 
             # Izvlichame klientite v marshuta
             # route.visits() e spisuk na indeksi na poseshheniya
@@ -475,25 +683,18 @@ class PyVRPSolver:
             except:
                 continue
             
-            for visit_idx in visits:
-                # Opredelyame koy e tozi indeks
-                num_depots = len(model.depots)
-                
-                if visit_idx < num_depots:
-                    # Tova e depo - preskachame
-                    continue
-                
-                # Tova e klient
-                client_idx = visit_idx - num_depots
-                if client_idx < len(self.customers):
-                    customer = self.customers[client_idx]
-                    route_customers.append(customer)
-                    dropped_customers.discard(customer.id)
-                    route_volume += customer.volume if hasattr(customer, 'volume') and customer.volume else 0
+            # Индексите на депата се пропускат, останалите се превеждат в индекси на клиенти
+            visits = np.asarray(visits, dtype=np.int64)
+            client_idxs = visits[visits >= num_depots] - num_depots
+            client_idxs = client_idxs[client_idxs < num_customers]
+            route_customers = [self.customers[client_idx] for client_idx in client_idxs.tolist()]
+            dropped_customers.difference_update(customer.id for customer in route_customers)
+            route_volume = float(self._volumes[client_idxs].sum())
 
             # Izchislyavaem razstoyanie i vreme za marshuta
             if route_customers:
                 # Namirame depoto za tozi marshut чрез vehicle_type
+                vt_index = None
                 try:
                     vt_index = route.vehicle_type()  # Връща индекс (int)
                     vt = vehicle_types_list[vt_index] if vt_index < len(vehicle_types_list) else None
@@ -509,7 +710,7 @@ class PyVRPSolver:
                     depot_location = self.unique_depots[0]
 
                 # Opredelyame tipa prevozno sredstvo ot marshuta
-                vehicle_type = self._get_vehicle_type_from_route(route, vehicle_types_list)
+                vehicle_type = vehicle_type_by_index.get(vt_index, default_vehicle_type)
                 vehicle_config = self._get_vehicle_config_for_type(vehicle_type)
 
                 # Izchislyavaem tochnoto vreme i razstoyanie
@@ -576,135 +777,79 @@ class PyVRPSolver:
         if not customers:
             return 0.0, 0.0
 
-        total_distance = 0.0
-        total_time = 0.0
-
         # Намираме индекса на депото в матрицата
-        depot_index = None
-        for i, depot in enumerate(self.unique_depots):
-            if depot == depot_location:
-                depot_index = i
-                break
+        depot_index = self._depot_index.get(tuple(depot_location))
 
         if depot_index is None:
             logger.warning(f"⚠️ Депо {depot_location} не намерено, използвам главното")
             depot_index = 0
 
-        # От депо до първия клиент
-        current_node = depot_index
-        
         if vehicle_config:
             service_time_s = vehicle_config.service_time_minutes * 60
         else:
             service_time_s = 15 * 60
 
-        # === ГРАДСКИ ТРАФИК: Настройки и определяне кои локации са в града ===
-        enable_traffic = False
-        traffic_multiplier = 1.0
-        city_center = None
-        city_radius = 0
-        
-        if self.location_config:
-            enable_traffic = getattr(self.location_config, 'enable_city_traffic_adjustment', False)
-            traffic_multiplier = getattr(self.location_config, 'city_traffic_duration_multiplier', 1.0)
-            city_center = getattr(self.location_config, 'city_center_coords', None)
-            city_radius = getattr(self.location_config, 'city_traffic_radius_km', 12.0)
-        
-        # Предварително определяме кои локации са в градската зона
-        num_locations = len(self.distance_matrix.distances)
-        locations_in_city = []
-        for loc_idx in range(num_locations):
-            if loc_idx < len(self.unique_depots):
-                lat, lon = self.unique_depots[loc_idx]
-            else:
-                client_idx = loc_idx - len(self.unique_depots)
-                if client_idx < len(self.customers):
-                    lat, lon = self.customers[client_idx].coordinates or (0, 0)
-                else:
-                    lat, lon = 0, 0
-            
-            in_city = False
-            if enable_traffic and city_center:
-                dist_to_city_center = calculate_distance_km((lat, lon), city_center)
-                in_city = dist_to_city_center <= city_radius
-            locations_in_city.append(in_city)
-
+        # Индекси в матрицата по реда на обхождане: депо -> клиенти -> депо
+        route_idx = [depot_index]
         for customer in customers:
-            # Намираме индекса на клиента в матрицата
-            try:
-                customer_matrix_idx = len(self.unique_depots) + self.customers.index(customer)
-            except ValueError:
+            customer_matrix_idx = self._customer_matrix_idx.get(customer.id)
+            if customer_matrix_idx is None:
                 logger.warning(f"⚠️ Клиент {customer.id} не намерен в списъка")
                 continue
-
-            # Добавяме разстояние
-            total_distance += self.distance_matrix.distances[current_node][customer_matrix_idx]
-            
-            # Добавяме време с трафик корекция
-            travel_time = self.distance_matrix.durations[current_node][customer_matrix_idx]
-            if enable_traffic and current_node < len(locations_in_city) and customer_matrix_idx < len(locations_in_city):
-                if locations_in_city[current_node] and locations_in_city[customer_matrix_idx]:
-                    travel_time = travel_time * traffic_multiplier
-            total_time += travel_time
-            total_time += service_time_s  # vehicle-specific service time
-
-            current_node = customer_matrix_idx
-
-        # От последния клиент обратно в депото
-        total_distance += self.distance_matrix.distances[current_node][depot_index]
-        travel_time_back = self.distance_matrix.durations[current_node][depot_index]
-        if enable_traffic and current_node < len(locations_in_city) and depot_index < len(locations_in_city):
-            if locations_in_city[current_node] and locations_in_city[depot_index]:
-                travel_time_back = travel_time_back * traffic_multiplier
-        total_time += travel_time_back
+            route_idx.append(customer_matrix_idx)
+        route_idx.append(depot_index)
+        route_idx = np.array(route_idx, dtype=np.int64)
+
+        if NUMBA_AVAILABLE:
+            # JIT компилиран цикъл по отсечките
+            total_distance, total_time = _route_distance_time(
+                self._distances_m, self._durations_s, self._in_city, route_idx,
+                float(self._traffic_multiplier), bool(self._enable_traffic),
+            )
+        else:
+            # Разстояния и времена за всички отсечки наведнъж
+            hops_from = route_idx[:-1]
+            hops_to = route_idx[1:]
+            total_distance = float(self._distances_m[hops_from, hops_to].sum())
+            travel_times = self._durations_s[hops_from, hops_to]
+            if self._enable_traffic:
+                # Корекция за трафик, ако и двете точки на отсечката са в града
+                in_city = self._in_city
+                travel_times = np.where(in_city[hops_from] & in_city[hops_to], travel_times * self._traffic_multiplier, travel_times)
+            total_time = float(travel_times.sum())
+        # Service time е vehicle-specific и се добавя за всеки обслужен клиент
+        total_time += service_time_s * (len(route_idx) - 2)
 
         return total_distance, total_time
 
     def _get_vehicle_config_for_type(self, vehicle_type) -> Optional[VehicleConfig]:
         vehicle_type_value = getattr(vehicle_type, "value", str(vehicle_type))
-        for v_config in self.vehicle_configs:
-            if v_config.enabled and v_config.vehicle_type.value == vehicle_type_value:
-                return v_config
-        for v_config in self.vehicle_configs:
-            if v_config.enabled:
-                return v_config
-        return None
+        v_config = self._vehicle_config_by_type.get(vehicle_type_value)
+        if v_config is not None:
+            return v_config
+        return self._enabled_vehicles[0] if self._enabled_vehicles else None
 
-    def _get_vehicle_type_from_route(self, route, vehicle_types_list) -> str:
+    def _vehicle_types_by_index(self, vehicle_types_list) -> Dict[int, object]:
         """
-        Определя типа превозно средство на маршрута.
+        Съпоставя индексите на vehicle types в PyVRP с нашия VehicleType enum.
 
         Args:
-            route: PyVRP Route
             vehicle_types_list: Списък с VehicleType обекти от problem_data.vehicle_types()
 
         Returns:
-            VehicleType стойност
+            Речник индекс -> VehicleType (или името като string, ако няма съвпадение)
         """
-        from config import VehicleType as ConfigVehicleType
-        
-        try:
-            # PyVRP Route има vehicle_type() метод който връща ИНДЕКС (int)
-            vt_index = route.vehicle_type()
-            
-            if isinstance(vt_index, int) and vt_index < len(vehicle_types_list):
-                vt = vehicle_types_list[vt_index]
-                vt_name = vt.name
-                
-                # Търсим съответния VehicleType enum
-                for config_vt in ConfigVehicleType:
-                    if config_vt.value == vt_name:
-                        return config_vt
-                
-                # Ако не намерим точно съвпадение, връщаме името като string
-                return vt_name
-        except Exception as e:
-            logger.warning(f"Could not get vehicle type from route: {e}")
-        
-        # По подразбиране връщаме първия enabled vehicle type
-        for v_config in self.vehicle_configs:
-            if v_config.enabled:
-                return v_config.vehicle_type
+        types_by_value = {config_vt.value: config_vt for config_vt in ConfigVehicleType}
+        return {
+            vt_index: types_by_value.get(vt.name, vt.name)
+            for vt_index, vt in enumerate(vehicle_types_list)
+        }
+
+    def _default_vehicle_type(self) -> ConfigVehicleType:
+        """Типът по подразбиране, ако маршрутът няма разпознат vehicle type"""
+        # Първият enabled vehicle type
+        if self._enabled_vehicles:
+            return self._enabled_vehicles[0].vehicle_type
         
         # Fallback
         return ConfigVehicleType.INTERNAL_BUS
@@ -4,19 +4,123 @@ Valhalla клиент за изчисляване на разстояния и 
 """
 
 import requests
+import asyncio
 import json
 import time
+import glob
+import hashlib
+import os
 import logging
-from typing import List, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Tuple, Optional
 from dataclasses import dataclass
 from datetime import datetime
+import numpy as np
 from tqdm import tqdm
 
 from config import get_config, ValhallaConfig
 from osrm_client import DistanceMatrix  # Използваме същия DistanceMatrix клас
+from numba_helpers import njit, prange, NUMBA_AVAILABLE
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# HTTP статуси, при които заявката се повтаря
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Грешки на HTTP слоя (requests или httpx)
+HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if HTTPX_AVAILABLE else ())
+
+
+def _json_dumps(payload) -> bytes:
+    """Сериализира JSON тяло на заявка - с orjson, ако е наличен"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode('utf-8')
+
+
+def _valhalla_locations(locations) -> List[dict]:
+    """Превръща (lat, lon) координати в Valhalla локации {"lat", "lon"}"""
+    coords = np.asarray(locations, dtype=np.float64).reshape(-1, 2).tolist()
+    return [{"lat": lat, "lon": lon} for lat, lon in coords]
+
+
+def _response_json(response: requests.Response):
+    """Парсва JSON отговор - с orjson, ако е наличен"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def _parse_sources_to_targets(data: dict, ns: int, nt: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Попълва предварително заделени (ns, nt) масиви от sources_to_targets отговора.
+    
+    Редовете се записват директно в буфера - без междинен list-of-lists за
+    цялата матрица. Разстоянията се връщат в метри, времената в секунди.
+    """
+    distances = np.zeros((ns, nt), dtype=np.float64)
+    durations = np.zeros((ns, nt), dtype=np.float64)
+    
+    # Успешните клетки винаги имат distance и time; липсващите (null) остават 0
+    for i, row in enumerate(data.get("sources_to_targets") or ()):
+        distances[i] = [c["distance"] if c else 0.0 for c in row]
+        durations[i] = [c["time"] if c else 0.0 for c in row]
+    
+    distances *= 1000  # km -> m
+    return distances, durations
+
+
+# Явната сигнатура компилира (или зарежда от кеша) kernel-а още при импорт,
+# а не при първия неуспешен batch, и пропуска type dispatch при всяко извикване
+@njit('Tuple((f8[:, ::1], f8[:, ::1]))(f8[:, ::1], i8[::1], i8[::1])',
+      parallel=True, fastmath=True, cache=True)
+def _fallback_block_nb(loc_rad, rows, cols):
+    """
+    Fallback блок за неуспешна batch заявка (паралелно по редове с Numba).
+    loc_rad са (lat, lon) в радиани; връща разстояния (м) и времена (сек) за rows x cols.
+    """
+    R = 6371000.0  # Радиус на Земята в метри
+    ns = rows.shape[0]
+    nt = cols.shape[0]
+    block_d = np.zeros((ns, nt))
+    block_t = np.zeros((ns, nt))
+    
+    for a in prange(ns):
+        i = rows[a]
+        lat1 = loc_rad[i, 0]
+        lon1 = loc_rad[i, 1]
+        cos_lat1 = np.cos(lat1)
+        for b in range(nt):
+            j = cols[b]
+            if i == j:
+                continue  # Диагоналът остава 0
+            lat2 = loc_rad[j, 0]
+            h = (np.sin((lat2 - lat1) / 2) ** 2 +
+                 cos_lat1 * np.cos(lat2) * np.sin((loc_rad[j, 1] - lon1) / 2) ** 2)
+            d = 2 * R * np.arcsin(np.sqrt(min(h, 1.0))) * 1.3
+            block_d[a, b] = d
+            block_t[a, b] = d / 1000 / 40 * 3600
+    
+    return block_d, block_t
+
 
 class ValhallaClient:
     """Клиент за Valhalla API"""
@@ -25,9 +129,57 @@ class ValhallaClient:
         self.config = config or get_config().valhalla
         self.routing_config = get_config().routing
         
+        # Параметрите са едни и същи за всички заявки в рамките на изпълнението
+        self._date_time_param = self._build_date_time_param()
+        self._costing_options = self._build_costing_options()
+        
+        # Общата част на всяка заявка - сменят се само локациите
+        self._request_template = {
+            "costing": self.config.costing,
+            **self._date_time_param,
+            **self._costing_options
+        }
+        
+        # HTTP клиент: httpx с HTTP/2 (multiplexing на паралелните заявки), ако е наличен
+        self.session = self._create_httpx_client() if self.config.use_http2 else None
+        self.uses_httpx = self.session is not None
+        if not self.uses_httpx:
+            self.session = self._create_requests_session()
+    
+    def _create_httpx_client(self):
+        """Създава httpx клиент с HTTP/2 или връща None, ако httpx/h2 липсват"""
+        if not HTTPX_AVAILABLE:
+            return None
+        
+        limits = httpx.Limits(
+            max_connections=self.config.max_concurrent_requests,
+            max_keepalive_connections=self.config.max_concurrent_requests
+        )
+        try:
+            # Transport-ът повтаря при грешки във връзката; 429/5xx се повтарят в _post
+            transport = httpx.HTTPTransport(
+                http2=True, limits=limits, retries=self.config.retry_attempts
+            )
+            # http2=True тук само проверява, че h2 е инсталиран (иначе ImportError)
+            return httpx.Client(
+                http2=True,
+                transport=transport,
+                timeout=self.config.timeout_seconds,
+                headers={
+                    'Content-Type': 'application/json',
+                    'User-Agent': 'CVRP-Optimizer/1.0'
+                }
+            )
+        except ImportError as e:
+            # http2=True изисква пакета h2
+            logger.warning(f"httpx HTTP/2 не е наличен ({e}) - използвам requests")
+            return None
+    
+    def _create_requests_session(self) -> requests.Session:
+        """Създава requests сесия с connection pooling и retry стратегия"""
         # HTTP session за по-бързи заявки
-        self.session = requests.Session()
-        self.session.headers.update({
+        session = requests.Session()
+        session.headers.update({
             'Content-Type': 'application/json',
             'User-Agent': 'CVRP-Optimizer/1.0'
         })
@@ -38,18 +190,47 @@ class ValhallaClient:
         
         retry_strategy = Retry(
             total=self.config.retry_attempts,
-            status_forcelist=[429, 500, 502, 503, 504],
+            status_forcelist=list(RETRY_STATUS_CODES),
             backoff_factor=0.5
         )
         
+        # Pool-ът е оразмерен за паралелните batch заявки
         adapter = HTTPAdapter(
-            pool_connections=10,
-            pool_maxsize=10,
+            pool_connections=self.config.max_concurrent_requests,
+            pool_maxsize=self.config.max_concurrent_requests,
             max_retries=retry_strategy
         )
         
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
+    def _post(self, url: str, request_body: dict):
+        """
+        POST заявка към Valhalla. Връща отговора след raise_for_status().
+        
+        При requests повторенията се правят от HTTPAdapter-а; при httpx
+        429/5xx отговорите се повтарят тук със същия експоненциален backoff.
+        """
+        # Тялото се сериализира веднъж (orjson) и се праща като готови байтове;
+        # Content-Type: application/json е в заглавките на сесията
+        payload = _json_dumps(request_body)
+        attempts = self.config.retry_attempts if self.uses_httpx else 0
+        for attempt in range(attempts + 1):
+            if self.uses_httpx:
+                response = self.session.post(
+                    url, content=payload, timeout=self.config.timeout_seconds
+                )
+            else:
+                response = self.session.post(
+                    url, data=payload, timeout=self.config.timeout_seconds
+                )
+            if response.status_code not in RETRY_STATUS_CODES or attempt == attempts:
+                break
+            time.sleep(0.5 * (2 ** attempt))
+        
+        response.raise_for_status()
+        return response
     
     def _build_date_time_param(self) -> dict:
         """Създава date_time параметър за time-dependent routing"""
@@ -105,14 +286,263 @@ class ValhallaClient:
         if self.routing_config.enable_time_dependent:
             logger.info(f"⏰ Time-dependent routing: {self.routing_config.departure_time}")
         
-        # За малки datasets (<=50) - използваме sources_to_targets API
-        if n_locations <= 50:
-            print(f"📡 Режим: Директна заявка (≤50 локации)")
-            return self._get_matrix_direct(locations)
-        else:
-            # За по-големи - batch подход
-            print(f"🧩 Режим: Batch заявки (>50 локации)")
-            return self._get_matrix_batched(locations)
+        # Повтарящи се координати (напр. клиенти в една сграда) се изпращат веднъж
+        if self.config.deduplicate_locations and n_locations > 1:
+            coords = np.round(np.asarray(locations, dtype=np.float64), self.config.dedup_decimals)
+            _, first_idx, inverse = np.unique(
+                coords, axis=0, return_index=True, return_inverse=True
+            )
+            if len(first_idx) < n_locations:
+                unique_locations = [locations[k] for k in first_idx]
+                print(f"🔁 Дублирани координати: {n_locations} -> {len(unique_locations)} уникални локации")
+                logger.info(f"🔁 Valhalla: {n_locations - len(unique_locations)} дублирани локации")
+                
+                matrix = self._compute_matrix(unique_locations)
+                
+                # Разгъване до пълната матрица с едно fancy-indexing събиране
+                inverse = inverse.reshape(-1)
+                expand = np.ix_(inverse, inverse)
+                return DistanceMatrix(
+                    distances=np.asarray(matrix.distances)[expand],
+                    durations=np.asarray(matrix.durations)[expand],
+                    locations=locations,
+                    sources=list(range(n_locations)),
+                    destinations=list(range(n_locations))
+                )
+        
+        return self._compute_matrix(locations)
+    
+    def _compute_matrix(self, locations: List[Tuple[float, float]]) -> DistanceMatrix:
+        """Матрица за дадените локации - от кеша или чрез директна/batch заявка"""
+        n_locations = len(locations)
+        
+        # Дисков кеш - при същите локации и routing настройки пропускаме заявките
+        cache_path = self._matrix_cache_path(locations) if self.config.use_cache else None
+        matrix = None
+        failed_batches = 0
+        if cache_path:
+            cached = self._load_cached_matrix(cache_path, locations)
+            if cached is not None:
+                return cached
+            
+            # Частичен кеш - преизползваме предишна матрица и искаме само новите редове/колони
+            if self.config.incremental_cache:
+                incremental = self._get_matrix_incremental(locations)
+                if incremental is not None:
+                    matrix, failed_batches = incremental
+        
+        if matrix is None:
+            # За малки datasets (<=50) - използваме sources_to_targets API
+            if n_locations <= 50:
+                print(f"📡 Режим: Директна заявка (≤50 локации)")
+                matrix = self._get_matrix_direct(locations)
+            else:
+                # За по-големи - batch подход
+                print(f"🧩 Режим: Batch заявки (>50 локации)")
+                matrix, failed_batches = self._get_matrix_batched(locations)
+        
+        # Матрица с неуспешни batch-ове съдържа haversine приближения - не я кешираме,
+        # иначе приближенията биха се връщали (и копирали от частичния кеш) като точни стойности
+        if cache_path and failed_batches == 0:
+            self._save_cached_matrix(cache_path, matrix)
+        elif cache_path:
+            logger.warning(f"Valhalla матрицата не е кеширана: {failed_batches} неуспешни batch-а")
+        
+        return matrix
+    
+    def _cache_settings_key(self) -> str:
+        """Кратък SHA-256 ключ на routing настройките (без локациите)"""
+        key_data = {
+            "costing": self.config.costing,
+            "costing_options": self._costing_options,
+            "tdep": self.routing_config.enable_time_dependent,
+            "time": self.routing_config.departure_time,
+            "date_time_type": self.config.date_time_type,
+            "base_url": self.config.base_url,
+            # При симетрия долният триъгълник е огледално копие - такава матрица не важи за асиметрични заявки
+            "symmetric": self._symmetric_requests()
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()[:16]
+    
+    def _symmetric_requests(self) -> bool:
+        """Дали матрицата се иска като симетрична (без time-dependent routing) - само горният триъгълник"""
+        return bool(self.config.exploit_symmetry and not self.routing_config.enable_time_dependent)
+    
+    def _matrix_cache_path(self, locations: List[Tuple[float, float]]) -> str:
+        """Път до .npz кеш файла: valhalla_matrix_<ключ на настройките>_<SHA-256 на локациите>.npz"""
+        locs = [(round(lat, 6), round(lon, 6)) for lat, lon in locations]
+        key = hashlib.sha256(json.dumps(locs).encode()).hexdigest()
+        return os.path.join(
+            get_config().cache.cache_dir,
+            f"valhalla_matrix_{self._cache_settings_key()}_{key}.npz"
+        )
+    
+    def _get_matrix_incremental(self, locations: List[Tuple[float, float]]) -> Optional[Tuple[DistanceMatrix, int]]:
+        """
+        Сглобява матрица от най-близката кеширана матрица със същите настройки.
+        
+        Клетките между вече познати локации се копират, а от Valhalla се искат
+        само редовете и колоните на новите локации. Връща (матрица, брой неуспешни
+        batch-ове) или None, ако няма подходяща кеширана матрица.
+        """
+        pattern = os.path.join(
+            get_config().cache.cache_dir, f"valhalla_matrix_{self._cache_settings_key()}_*.npz"
+        )
+        candidates = sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)
+        
+        n = len(locations)
+        rounded = [tuple(loc) for loc in np.round(np.asarray(locations, dtype=np.float64), 6).tolist()]
+        
+        # Избираме кешираната матрица с най-много общи локации
+        best_path, best_old_idx, best_known = None, None, 0
+        for path in candidates[:self.config.incremental_cache_candidates]:
+            age_hours = (time.time() - os.path.getmtime(path)) / 3600
+            if age_hours > self.config.cache_expiry_hours:
+                continue
+            try:
+                with np.load(path) as data:
+                    if "locations" not in data.files:
+                        continue
+                    old_locations = data["locations"].tolist()
+            except Exception as e:
+                logger.warning(f"Грешка при четене на Valhalla кеша {path}: {e}")
+                continue
+            
+            old_index = {tuple(loc): k for k, loc in enumerate(old_locations)}
+            old_idx = np.array([old_index.get(loc, -1) for loc in rounded], dtype=np.int64)
+            known = int((old_idx >= 0).sum())
+            if known > best_known:
+                best_path, best_old_idx, best_known = path, old_idx, known
+        
+        if best_path is None:
+            return None
+        
+        # При малко общи локации сглобяването е по-скъпо от нова пълна матрица
+        min_known = self.config.incremental_cache_min_overlap * n
+        if best_known < min_known:
+            logger.info(f"💾 Valhalla: частичният кеш е пропуснат - само {best_known} от {n} познати локации")
+            return None
+        
+        try:
+            with np.load(best_path) as data:
+                old_distances = data["distances"]
+                old_durations = data["durations"]
+        except Exception as e:
+            logger.warning(f"Грешка при зареждане на Valhalla кеша: {e}")
+            return None
+        
+        known_idx = np.flatnonzero(best_old_idx >= 0)
+        new_idx = np.flatnonzero(best_old_idx < 0)
+        
+        print(f"💾 Частичен кеш: {len(known_idx)} познати, {len(new_idx)} нови локации "
+              f"({os.path.basename(best_path)})")
+        logger.info(f"💾 Valhalla: частичен кеш - {len(new_idx)} нови от {n} локации")
+        
+        distances = np.zeros((n, n), dtype=np.float64)
+        durations = np.zeros((n, n), dtype=np.float64)
+        
+        old_known = np.ix_(best_old_idx[known_idx], best_old_idx[known_idx])
+        distances[np.ix_(known_idx, known_idx)] = old_distances[old_known]
+        durations[np.ix_(known_idx, known_idx)] = old_durations[old_known]
+        
+        failed_batches = 0
+        if len(new_idx):
+            # Редовете на новите локации (към всички) + колоните им от познатите локации.
+            # При симетрия колоните не се искат - копират се транспонирани от новите редове
+            batch_size = 50
+            symmetric = self._symmetric_requests()
+            blocks = None
+            successful_batches = 0
+            if self.config.matrix_row_strips:
+                # Както в batch режима - една заявка на batch източника към всички цели
+                strips = [(new_idx[i:i + batch_size], slice(0, n))
+                          for i in range(0, len(new_idx), batch_size)]
+                if not symmetric:
+                    strips += [(known_idx[i:i + batch_size], new_idx)
+                               for i in range(0, len(known_idx), batch_size)]
+                if self._probe_row_strip(locations, strips[0], distances, durations):
+                    successful_batches = 1
+                    blocks = strips[1:]
+            
+            if blocks is None:
+                blocks = [
+                    (new_idx[i:i + batch_size], slice(j, min(j + batch_size, n)))
+                    for i in range(0, len(new_idx), batch_size)
+                    for j in range(0, n, batch_size)
+                ]
+                if not symmetric:
+                    blocks += [
+                        (known_idx[i:i + batch_size], new_idx[j:j + batch_size])
+                        for i in range(0, len(known_idx), batch_size)
+                        for j in range(0, len(new_idx), batch_size)
+                    ]
+            
+            total_requests = successful_batches + len(blocks)
+            ok, failed_batches = self._fill_blocks(locations, blocks, distances, durations)
+            successful_batches += ok
+            
+            if symmetric:
+                distances[np.ix_(known_idx, new_idx)] = distances[np.ix_(new_idx, known_idx)].T
+                durations[np.ix_(known_idx, new_idx)] = durations[np.ix_(new_idx, known_idx)].T
+            
+            print(f"   ✅ Успешни: {successful_batches}/{total_requests}, "
+                  f"❌ Неуспешни: {failed_batches}/{total_requests}")
+        
+        return DistanceMatrix(
+            distances=distances,
+            durations=durations,
+            locations=locations,
+            sources=list(range(n)),
+            destinations=list(range(n))
+        ), failed_batches
+    
+    def _load_cached_matrix(self, cache_path: str,
+                            locations: List[Tuple[float, float]]) -> Optional[DistanceMatrix]:
+        """Зарежда матрица от кеша, ако съществува и не е изтекла"""
+        if not os.path.exists(cache_path):
+            return None
+        
+        age_hours = (time.time() - os.path.getmtime(cache_path)) / 3600
+        if age_hours > self.config.cache_expiry_hours:
+            logger.info(f"Valhalla кешът е изтекъл ({age_hours:.1f} ч.): {cache_path}")
+            return None
+        
+        try:
+            with np.load(cache_path) as data:
+                distances = data["distances"]
+                durations = data["durations"]
+        except Exception as e:
+            logger.warning(f"Грешка при зареждане на Valhalla кеша: {e}")
+            return None
+        
+        n = len(locations)
+        if distances.shape != (n, n) or durations.shape != (n, n):
+            return None
+        
+        print(f"💾 Матрицата е заредена от кеша: {os.path.basename(cache_path)}")
+        logger.info(f"💾 Valhalla: Матрица {n}x{n} заредена от кеша")
+        
+        return DistanceMatrix(
+            distances=distances,
+            durations=durations,
+            locations=locations,
+            sources=list(range(n)),
+            destinations=list(range(n))
+        )
+    
+    def _save_cached_matrix(self, cache_path: str, matrix: DistanceMatrix) -> None:
+        """Записва матрицата в .npz кеш файл"""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            np.savez_compressed(
+                cache_path,
+                distances=np.asarray(matrix.distances, dtype=np.float64),
+                durations=np.asarray(matrix.durations, dtype=np.float64),
+                locations=np.round(np.asarray(matrix.locations, dtype=np.float64), 6)
+            )
+            logger.info(f"💾 Valhalla матрицата е кеширана: {cache_path}")
+        except Exception as e:
+            logger.warning(f"Грешка при запис на Valhalla кеша: {e}")
     
     def _get_matrix_direct(self, locations: List[Tuple[float, float]]) -> DistanceMatrix:
         """Получава матрица директно чрез sources_to_targets API"""
@@ -121,19 +551,16 @@ class ValhallaClient:
         print(f"   URL: {self.config.base_url}/sources_to_targets")
         
         # Подготовка на локациите
-        valhalla_locations = [{"lat": lat, "lon": lon} for lat, lon in locations]
+        valhalla_locations = _valhalla_locations(locations)
         
         # Построяване на заявката
+        # Шаблонът съдържа costing, time-dependent и costing_options параметрите
         request_body = {
             "sources": valhalla_locations,
             "targets": valhalla_locations,
-            "costing": self.config.costing
+            **self._request_template
         }
         
-        # Добавяме time-dependent параметри
-        request_body.update(self._build_date_time_param())
-        request_body.update(self._build_costing_options())
-        
         url = f"{self.config.base_url}/sources_to_targets"
         
         try:
@@ -141,36 +568,23 @@ class ValhallaClient:
             start_time = time_module.time()
             
             logger.info(f"📡 Valhalla API заявка: {n}x{n} матрица")
-            response = self.session.post(
-                url,
-                json=request_body,
-                timeout=self.config.timeout_seconds
-            )
-            response.raise_for_status()
-            data = response.json()
+            response = self._post(url, request_body)
+            data = _response_json(response)
             
             elapsed = time_module.time() - start_time
             print(f"✅ Отговор получен за {elapsed:.2f} секунди")
             
             # Парсване на отговора
             print(f"📊 Парсване на матрицата...")
-            distances = [[0.0 for _ in range(n)] for _ in range(n)]
-            durations = [[0.0 for _ in range(n)] for _ in range(n)]
-            
             # Valhalla връща sources_to_targets като list of lists
+            distances, durations = _parse_sources_to_targets(data, n, n)
             if "sources_to_targets" in data:
-                total_cells = 0
-                for i, row in enumerate(data["sources_to_targets"]):
-                    for j, cell in enumerate(row):
-                        if cell:
-                            distances[i][j] = cell.get("distance", 0) * 1000  # km -> m
-                            durations[i][j] = cell.get("time", 0)  # вече в секунди
-                            total_cells += 1
+                total_cells = sum(1 for row in data["sources_to_targets"] for c in row if c)
                 print(f"✅ Парсирани {total_cells} клетки от матрицата")
             
             # Статистика
-            max_dist = max(max(row) for row in distances) / 1000
-            max_time = max(max(row) for row in durations) / 60
+            max_dist = distances.max() / 1000
+            max_time = durations.max() / 60
             print(f"\n📈 Статистика:")
             print(f"   Макс. разстояние: {max_dist:.1f} км")
             print(f"   Макс. време: {max_time:.1f} мин")
@@ -186,78 +600,78 @@ class ValhallaClient:
                 destinations=list(range(n))
             )
             
-        except requests.exceptions.RequestException as e:
+        except HTTP_ERRORS as e:
             print(f"❌ ГРЕШКА: {e}")
             logger.error(f"❌ Valhalla API грешка: {e}")
             raise
     
-    def _get_matrix_batched(self, locations: List[Tuple[float, float]]) -> DistanceMatrix:
-        """Получава матрица на части за големи datasets"""
+    def _get_matrix_batched(self, locations: List[Tuple[float, float]]) -> Tuple[DistanceMatrix, int]:
+        """Получава матрица на части за големи datasets. Връща (матрица, брой неуспешни batch-ове)"""
         import time as time_module
         
         n = len(locations)
         batch_size = 50
         
         num_batches = (n + batch_size - 1) // batch_size
-        total_requests = num_batches * num_batches
+        
+        # Без time-dependent routing матрицата е (приблизително) симетрична -
+        # искаме само горния триъгълник от блокове и огледално копираме долния
+        symmetric = self._symmetric_requests()
         
         print(f"\n🧩 Batch режим:")
         print(f"   Общо локации: {n}")
         print(f"   Batch размер: {batch_size}")
-        print(f"   Брой batches: {num_batches}x{num_batches} = {total_requests} заявки")
         print(f"   URL: {self.config.base_url}/sources_to_targets\n")
         
         logger.info(f"🧩 Valhalla batch режим: {n} локации с batches от {batch_size}")
         
-        distances = [[0.0 for _ in range(n)] for _ in range(n)]
-        durations = [[0.0 for _ in range(n)] for _ in range(n)]
+        distances = np.zeros((n, n), dtype=np.float64)
+        durations = np.zeros((n, n), dtype=np.float64)
         
         start_time = time_module.time()
-        successful_batches = 0
-        failed_batches = 0
         
-        with tqdm(total=total_requests, desc="🗺️ Valhalla batches", unit="batch") as pbar:
-            for i in range(0, n, batch_size):
-                end_i = min(i + batch_size, n)
-                sources = locations[i:end_i]
-                
-                for j in range(0, n, batch_size):
-                    end_j = min(j + batch_size, n)
-                    targets = locations[j:end_j]
-                    
-                    try:
-                        batch_matrix = self._get_submatrix(sources, targets)
-                        
-                        # Копиране в главната матрица
-                        for si, src_idx in enumerate(range(i, end_i)):
-                            for ti, tgt_idx in enumerate(range(j, end_j)):
-                                distances[src_idx][tgt_idx] = batch_matrix['distances'][si][ti]
-                                durations[src_idx][tgt_idx] = batch_matrix['durations'][si][ti]
-                        
-                        successful_batches += 1
-                        
-                    except Exception as e:
-                        logger.warning(f"Batch {i}-{end_i} x {j}-{end_j} неуспешен: {e}")
-                        failed_batches += 1
-                        # Fallback към приблизителни стойности
-                        for si, src_idx in enumerate(range(i, end_i)):
-                            for ti, tgt_idx in enumerate(range(j, end_j)):
-                                if src_idx != tgt_idx:
-                                    approx = self._haversine_distance(
-                                        locations[src_idx], locations[tgt_idx]
-                                    ) * 1.3
-                                    distances[src_idx][tgt_idx] = approx
-                                    durations[src_idx][tgt_idx] = approx / 1000 / 40 * 3600
-                    
-                    pbar.update(1)
-                    pbar.set_postfix({'✅': successful_batches, '❌': failed_batches})
-                    time.sleep(0.01)
+        blocks = None
+        successful_batches = 0
+        if self.config.matrix_row_strips:
+            # Една заявка на ред от batch-а: batch_size източника към всички цели
+            # (при симетрия - само целите от диагонала надясно)
+            strips = [
+                (slice(i, min(i + batch_size, n)), slice(i if symmetric else 0, n))
+                for i in range(0, n, batch_size)
+            ]
+            # Първата лента е проба - сървърът може да отхвърли широки заявки
+            # (service_limits.max_matrix_location_pairs); тогава минаваме на квадрати
+            if self._probe_row_strip(locations, strips[0], distances, durations, mirror=symmetric):
+                successful_batches = 1
+                blocks = strips[1:]
+                print(f"   Режим: {len(strips)} row-strip заявки ({batch_size}x{n})"
+                      f"{' (симетрична матрица)' if symmetric else ''}")
+        
+        if blocks is None:
+            # Всички блокове (i, j) - заявките са I/O-bound и се изпращат паралелно.
+            # Без time-dependent routing матрицата е (приблизително) симетрична -
+            # искаме само горния триъгълник от блокове и огледално копираме долния.
+            # Диагоналните блокове се искат целите (еднопосочни улици и т.н.)
+            blocks = [
+                (slice(i, min(i + batch_size, n)), slice(j, min(j + batch_size, n)))
+                for i in range(0, n, batch_size)
+                for j in range(0, n, batch_size)
+                if not symmetric or j >= i
+            ]
+            print(f"   Режим: {num_batches}x{num_batches} блока -> {len(blocks)} заявки"
+                  f"{' (симетрична матрица)' if symmetric else ''}")
+        
+        total_requests = successful_batches + len(blocks)
+        ok, failed_batches = self._fill_blocks(
+            locations, blocks, distances, durations, mirror=symmetric
+        )
+        successful_batches += ok
         
         elapsed = time_module.time() - start_time
         
         # Статистика
-        max_dist = max(max(row) for row in distances) / 1000
-        max_time = max(max(row) for row in durations) / 60
+        max_dist = distances.max() / 1000
+        max_time = durations.max() / 60
         
         print(f"\n{'='*60}")
         print(f"✅ Valhalla матрица завършена!")
@@ -277,44 +691,198 @@ class ValhallaClient:
             locations=locations,
             sources=list(range(n)),
             destinations=list(range(n))
-        )
+        ), failed_batches
     
-    def _get_submatrix(self, sources: List[Tuple[float, float]], 
-                       targets: List[Tuple[float, float]]) -> dict:
-        """Получава подматрица от Valhalla"""
-        valhalla_sources = [{"lat": lat, "lon": lon} for lat, lon in sources]
-        valhalla_targets = [{"lat": lat, "lon": lon} for lat, lon in targets]
+    def _probe_row_strip(self, locations: List[Tuple[float, float]], strip: tuple,
+                         distances: np.ndarray, durations: np.ndarray, mirror: bool = False) -> bool:
+        """
+        Изпраща първата row-strip заявка като проба и записва резултата в матриците.
+        Сървърът може да отхвърли широки заявки (service_limits.max_matrix_location_pairs) -
+        тогава връща False и извикващият минава на 50x50 блокове.
+        """
+        src, tgt = strip
+        all_idx = np.arange(len(locations))
+        rows, cols = all_idx[src], all_idx[tgt]
+        try:
+            probe = self._get_submatrix(
+                _valhalla_locations([locations[i] for i in rows.tolist()]),
+                _valhalla_locations([locations[j] for j in cols.tolist()])
+            )
+        except Exception as e:
+            logger.warning(f"Row-strip заявка отхвърлена ({e}) - използвам 50x50 блокове")
+            return False
         
-        request_body = {
-            "sources": valhalla_sources,
-            "targets": valhalla_targets,
-            "costing": self.config.costing
-        }
+        if mirror:
+            distances[np.ix_(cols, rows)] = probe['distances'].T
+            durations[np.ix_(cols, rows)] = probe['durations'].T
+        distances[np.ix_(rows, cols)] = probe['distances']
+        durations[np.ix_(rows, cols)] = probe['durations']
+        return True
+    
+    def _fill_blocks(self, locations: List[Tuple[float, float]], blocks: list,
+                     distances: np.ndarray, durations: np.ndarray,
+                     mirror: bool = False) -> Tuple[int, int]:
+        """
+        Изпраща паралелно sources_to_targets заявки за блоковете и попълва матриците.
+        
+        Всеки блок е (src, tgt) - slice или масив с индекси в locations.
+        При mirror=True недиагоналните блокове се копират и транспонирани.
+        При неуспешна заявка блокът се попълва с haversine приближение.
+        Връща (успешни, неуспешни) заявки.
+        """
+        n = len(locations)
+        all_idx = np.arange(n)
         
-        request_body.update(self._build_date_time_param())
-        request_body.update(self._build_costing_options())
+        # Координати в радиани - за векторизирания haversine fallback
+        loc_rad = np.radians(np.asarray(locations, dtype=np.float64))
         
+        # Valhalla локациите се създават веднъж; заявките вземат само референции към тях
+        valhalla_locations = _valhalla_locations(locations)
+        
+        successful_batches = 0
+        failed_batches = 0
+        
+        def store_block(block_info, result):
+            """Записва резултата (или haversine fallback при грешка) в матриците"""
+            nonlocal successful_batches, failed_batches
+            src, tgt, rows, cols = block_info
+            # Непрекъснатите блокове се копират със slice, останалите с np.ix_
+            if isinstance(src, slice) and isinstance(tgt, slice):
+                key, mirror_key = (src, tgt), (tgt, src)
+            else:
+                key, mirror_key = np.ix_(rows, cols), np.ix_(cols, rows)
+            
+            if isinstance(result, Exception):
+                # Lazy %-форматиране - при изключен WARNING низът не се сглобява
+                logger.warning("Batch %d-%d x %d-%d неуспешен: %s",
+                               rows[0], rows[-1] + 1, cols[0], cols[-1] + 1, result)
+                failed_batches += 1
+                # Fallback към приблизителни стойности за целия блок наведнъж
+                block_d, block_t = self._fallback_block(loc_rad, rows, cols)
+            else:
+                block_d = result['distances']
+                block_t = result['durations']
+                successful_batches += 1
+            
+            # Копиране в главната матрица (едно присвояване на блок).
+            # Огледалното копие се записва първо - ако блокът застъпва
+            # диагонала (row-strip), там остават реално заявените стойности
+            if mirror and not np.array_equal(rows, cols):
+                distances[mirror_key] = block_d.T
+                durations[mirror_key] = block_t.T
+            distances[key] = block_d
+            durations[key] = block_t
+            
+            pbar.update(1)
+            pbar.set_postfix({'✅': successful_batches, '❌': failed_batches})
+        
+        block_infos = [(src, tgt, all_idx[src], all_idx[tgt]) for src, tgt in blocks]
+        
+        with tqdm(total=len(blocks), desc="🗺️ Valhalla batches", unit="batch") as pbar:
+            if self._use_async_requests():
+                asyncio.run(self._fetch_blocks_async(valhalla_locations, block_infos, store_block))
+            else:
+                max_workers = max(1, min(self.config.max_concurrent_requests, len(blocks)))
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {
+                        executor.submit(
+                            self._get_submatrix,
+                            [valhalla_locations[k] for k in rows],
+                            [valhalla_locations[k] for k in cols]
+                        ): (src, tgt, rows, cols)
+                        for src, tgt, rows, cols in block_infos
+                    }
+                    for future in as_completed(futures):
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = e
+                        store_block(futures[future], result)
+        
+        return successful_batches, failed_batches
+    
+    def _use_async_requests(self) -> bool:
+        """Дали batch заявките да минат през asyncio + aiohttp"""
+        if not (self.config.use_async_requests and AIOHTTP_AVAILABLE):
+            return False
+        try:
+            # asyncio.run() не може да се вика от вече работещ event loop
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return True
+        return False
+    
+    async def _fetch_blocks_async(self, valhalla_locations: List[dict],
+                                  block_infos: list, store_block: Callable) -> None:
+        """Изпраща всички блокове конкурентно (aiohttp, ограничено със семафор)"""
+        limit = max(1, self.config.max_concurrent_requests)
+        semaphore = asyncio.Semaphore(limit)
+        connector = aiohttp.TCPConnector(limit=limit)
+        timeout = aiohttp.ClientTimeout(total=self.config.timeout_seconds)
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'CVRP-Optimizer/1.0'
+        }
+        
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=headers) as session:
+            async def fetch(block_info):
+                _, _, rows, cols = block_info
+                async with semaphore:
+                    try:
+                        result = await self._get_submatrix_async(
+                            session,
+                            [valhalla_locations[k] for k in rows],
+                            [valhalla_locations[k] for k in cols]
+                        )
+                    except Exception as e:
+                        result = e
+                return block_info, result
+            
+            for next_done in asyncio.as_completed([fetch(info) for info in block_infos]):
+                block_info, result = await next_done
+                store_block(block_info, result)
+    
+    async def _get_submatrix_async(self, session, sources: List[dict],
+                                   targets: List[dict]) -> dict:
+        """Асинхронен вариант на _get_submatrix (aiohttp), със същите повторения при 429/5xx"""
+        payload = _json_dumps(self._submatrix_request_body(sources, targets))
         url = f"{self.config.base_url}/sources_to_targets"
         
-        response = self.session.post(
-            url,
-            json=request_body,
-            timeout=self.config.timeout_seconds
-        )
-        response.raise_for_status()
-        data = response.json()
+        attempts = self.config.retry_attempts
+        for attempt in range(attempts + 1):
+            try:
+                async with session.post(url, data=payload) as response:
+                    if response.status not in RETRY_STATUS_CODES or attempt == attempts:
+                        response.raise_for_status()
+                        raw = await response.read()
+                        break
+            except aiohttp.ClientConnectionError:
+                if attempt == attempts:
+                    raise
+            await asyncio.sleep(0.5 * (2 ** attempt))
+        
+        data = orjson.loads(raw) if ORJSON_AVAILABLE else json.loads(raw)
+        distances, durations = _parse_sources_to_targets(data, len(sources), len(targets))
+        
+        return {"distances": distances, "durations": durations}
+    
+    def _submatrix_request_body(self, sources: List[dict], targets: List[dict]) -> dict:
+        """Тяло на sources_to_targets заявка за подматрица (sources/targets са Valhalla локации)"""
+        return {"sources": sources, "targets": targets, **self._request_template}
+    
+    def _get_submatrix(self, sources: List[dict], targets: List[dict]) -> dict:
+        """
+        Получава подматрица от Valhalla (като np.ndarray блокове ns x nt).
+        sources/targets са готови Valhalla локации ({"lat", "lon"}).
+        """
+        request_body = self._submatrix_request_body(sources, targets)
+        url = f"{self.config.base_url}/sources_to_targets"
         
-        ns = len(sources)
-        nt = len(targets)
-        distances = [[0.0 for _ in range(nt)] for _ in range(ns)]
-        durations = [[0.0 for _ in range(nt)] for _ in range(ns)]
+        response = self._post(url, request_body)
+        data = _response_json(response)
         
-        if "sources_to_targets" in data:
-            for i, row in enumerate(data["sources_to_targets"]):
-                for j, cell in enumerate(row):
-                    if cell:
-                        distances[i][j] = cell.get("distance", 0) * 1000
-                        durations[i][j] = cell.get("time", 0)
+        distances, durations = _parse_sources_to_targets(data, len(sources), len(targets))
         
         return {"distances": distances, "durations": durations}
     
@@ -326,22 +894,14 @@ class ValhallaClient:
                 {"lat": origin[0], "lon": origin[1]},
                 {"lat": destination[0], "lon": destination[1]}
             ],
-            "costing": self.config.costing,
+            **self._request_template,
             "directions_options": {"units": "kilometers"}
         }
         
-        request_body.update(self._build_date_time_param())
-        request_body.update(self._build_costing_options())
-        
         url = f"{self.config.base_url}/route"
         
-        response = self.session.post(
-            url,
-            json=request_body,
-            timeout=self.config.timeout_seconds
-        )
-        response.raise_for_status()
-        data = response.json()
+        response = self._post(url, request_body)
+        data = _response_json(response)
         
         if "trip" in data and "legs" in data["trip"]:
             leg = data["trip"]["legs"][0]["summary"]
@@ -373,6 +933,39 @@ class ValhallaClient:
         
         return R * c
     
+    def _fallback_block(self, loc_rad: np.ndarray, rows: np.ndarray,
+                        cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Приблизителен блок (разстояния, времена) при неуспешна заявка - haversine * 1.3 при 40 км/ч"""
+        if NUMBA_AVAILABLE:
+            return _fallback_block_nb(
+                np.ascontiguousarray(loc_rad, dtype=np.float64),
+                np.ascontiguousarray(rows, dtype=np.int64),
+                np.ascontiguousarray(cols, dtype=np.int64)
+            )
+        
+        block_d = self._haversine_matrix(loc_rad[rows], loc_rad[cols]) * 1.3
+        # Диагоналът (src == tgt) остава 0
+        block_d[rows[:, None] == cols[None, :]] = 0.0
+        block_t = block_d / 1000 / 40 * 3600
+        return block_d, block_t
+    
+    def _haversine_matrix(self, src_rad: np.ndarray, tgt_rad: np.ndarray) -> np.ndarray:
+        """
+        Haversine разстояния (в метри) между всички двойки точки.
+        Приема масиви (ns, 2) и (nt, 2) с (lat, lon) в радиани, връща (ns, nt).
+        """
+        R = 6371000  # Радиус на Земята в метри
+        
+        src_lat = src_rad[:, 0][:, None]
+        tgt_lat = tgt_rad[:, 0][None, :]
+        delta_phi = tgt_lat - src_lat
+        delta_lambda = tgt_rad[:, 1][None, :] - src_rad[:, 1][:, None]
+        
+        a = (np.sin(delta_phi / 2) ** 2 +
+             np.cos(src_lat) * np.cos(tgt_lat) * np.sin(delta_lambda / 2) ** 2)
+        
+        return 2 * R * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    
     def check_server_status(self) -> bool:
         """Проверява дали Valhalla сървърът е достъпен"""
         try:
@@ -5,8 +5,11 @@
 
 from typing import List, Tuple, Dict, Optional, Any
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import chain
 import logging
 import math
+import numpy as np
 from config import (
     get_config,
     WarehouseConfig,
@@ -16,18 +19,14 @@ from config import (
     is_location_in_center_zone,
 )
 from input_handler import Customer, InputData
+from numba_helpers import njit, vectorize
 
 logger = logging.getLogger(__name__)
 
 
-def calculate_distance_km(coord1: Optional[Tuple[float, float]], coord2: Tuple[float, float]) -> float:
-    """Изчислява разстоянието между две GPS координати в километри (Haversine формула)"""
-    if not coord1 or not coord2:
-        return 0.0
-    
-    lat1, lon1 = math.radians(coord1[0]), math.radians(coord1[1])
-    lat2, lon2 = math.radians(coord2[0]), math.radians(coord2[1])
-    
+@njit('f8(f8, f8, f8, f8)', cache=True, fastmath=True)
+def _haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine разстояние в км между две точки, зададени в радиани (JIT компилирано, ако има Numba)"""
     dlat = lat2 - lat1
     dlon = lon2 - lon1
     
@@ -37,12 +36,35 @@ def calculate_distance_km(coord1: Optional[Tuple[float, float]], coord2: Tuple[f
     return 6371 * c  # 6371 km е радиусът на Земята
 
 
+@vectorize(['f8(f8, f8, f8, f8)'], cache=True)
+def _haversine_term(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Членът a = sin²(Δφ/2) + cos φ1 cos φ2 sin²(Δλ/2) от Haversine формулата за точки в радиани.
+    NumPy ufunc (компилиран с Numba, ако я има) - работи директно върху масиви, NaN се пропуска през.
+    """
+    return np.sin((lat2 - lat1)/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1)/2)**2
+
+
+def calculate_distance_km(coord1: Optional[Tuple[float, float]], coord2: Tuple[float, float]) -> float:
+    """Изчислява разстоянието между две GPS координати в километри (Haversine формула)"""
+    if not coord1 or not coord2:
+        return 0.0
+    
+    return _haversine(math.radians(coord1[0]), math.radians(coord1[1]),
+                      math.radians(coord2[0]), math.radians(coord2[1]))
+
+
 def is_in_center_zone(customer_coords: Optional[Tuple[float, float]], center_location: Tuple[float, float], radius_km: float) -> bool:
     """Проверява дали клиентът е в център зоната"""
     distance = calculate_distance_km(customer_coords, center_location)
     return distance <= radius_km
 
 
+def _total_volume(customers: List[Customer]) -> float:
+    """Сумира обема на клиентите с math.fsum (без натрупване на грешки при много клиенти)"""
+    return math.fsum(c.volume for c in customers)
+
+
 @dataclass
 class WarehouseAllocation:
     """Разпределение между превозни средства и склад"""
@@ -59,9 +81,10 @@ class WarehouseManager:
     """Мениджър за складова логика"""
     
     def __init__(self, config: Optional[WarehouseConfig] = None):
-        self.config = config or get_config().warehouse
-        self.vehicle_configs = get_config().vehicles
-        self.location_config = get_config().locations
+        main_config = get_config()
+        self.config = config or main_config.warehouse
+        self.vehicle_configs = main_config.vehicles
+        self.location_config = main_config.locations
     
     def allocate_customers(self, input_data: InputData) -> WarehouseAllocation:
         """Разпределя клиентите между превозни средства и склад по новата логика"""
@@ -70,15 +93,20 @@ class WarehouseManager:
         # Изчисляване на общия капацитет
         total_capacity = self._calculate_total_vehicle_capacity()
         
+        # Обемите и координатите се извличат веднъж в масиви (SoA) и се ползват от всички стъпки
+        customers = input_data.customers
+        volumes, coords = self._customer_arrays(customers)
+        
         # Сортиране на клиентите по обем (от най-малък към най-голям)
         # и за клиенти с еднакъв обем - по разстояние (от най-далечен към най-близък)
-        sorted_customers = self._sort_customers(input_data.customers)
+        order = self._sort_customers(volumes, coords)
+        sorted_customers = [customers[i] for i in order.tolist()]
         
         logger.info(f"Сортирани {len(sorted_customers)} клиента по обем (най-малък → най-голям) "
                    f"и разстояние (най-далечен → най-близък)")
         
         # Прилагаме новата логика за разпределение
-        return self._allocate_with_warehouse(sorted_customers, total_capacity)
+        return self._allocate_with_warehouse(sorted_customers, total_capacity, volumes[order], coords[order])
     
     def _calculate_total_vehicle_capacity(self) -> int:
         """Изчислява общия капацитет на всички включени превозни средства"""
@@ -102,40 +130,68 @@ class WarehouseManager:
         
         return max_capacity
     
-    def _sort_customers(self, customers: List[Customer]) -> List[Customer]:
+    @staticmethod
+    def _customer_arrays(customers: List[Customer]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Връща обемите (N,) и координатите (N, 2) на клиентите като NumPy масиви.
+        Клиентите без координати получават NaN.
+        """
+        volumes = np.fromiter((c.volume for c in customers), dtype=np.float64, count=len(customers))
+        coords = np.array([c.coordinates if c.coordinates else (math.nan, math.nan) for c in customers],
+                          dtype=np.float64).reshape(-1, 2)
+        return volumes, coords
+    
+    @staticmethod
+    def _haversine_terms(coords: np.ndarray, target: Tuple[float, float]) -> np.ndarray:
+        """
+        Връща члена a = sin²(Δφ/2) + cos φ1 cos φ2 sin²(Δλ/2) от Haversine формулата за всички координати.
+        Разстоянието 2R·asin(√a) е монотонно по a, така че за сравнения с праг стига самото a.
+        """
+        return _haversine_term(np.radians(coords[:, 0]), np.radians(coords[:, 1]),
+                               math.radians(target[0]), math.radians(target[1]))
+    
+    @staticmethod
+    def _compute_distances(coords: np.ndarray, target: Tuple[float, float]) -> np.ndarray:
+        """
+        Изчислява наведнъж (векторизирано с NumPy) разстоянията в км от всички координати до target.
+        За липсващи координати (NaN) резултатът е NaN.
+        """
+        return 6371 * 2 * np.arcsin(np.sqrt(WarehouseManager._haversine_terms(coords, target)))
+    
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _depot_distances(coords_key: bytes, depot_location: Tuple[float, float]) -> np.ndarray:
+        """
+        Разстояния до депото за сортирането, кеширани по байтовете на масива с координати.
+        При повторно разпределение на същите клиенти (напр. при настройка) не се изчисляват отново.
+        Клиентите без координати се броят за най-близки (разстояние 0). Резултатът е само за четене.
+        """
+        coords = np.frombuffer(coords_key, dtype=np.float64).reshape(-1, 2)
+        distances = np.nan_to_num(WarehouseManager._compute_distances(coords, depot_location), nan=0.0)
+        distances.flags.writeable = False
+        return distances
+    
+    def _sort_customers(self, volumes: np.ndarray, coords: np.ndarray) -> np.ndarray:
         """
-        Сортира клиентите по обем (от най-малък към най-голям)
+        Връща реда на клиентите, сортирани по обем (от най-малък към най-голям)
         и след това по разстояние (от най-далечен към най-близък) до депото
         """
         # Взимаме депо локацията от конфигурацията
         depot_location = self.location_config.depot_location
         
-        # Първо сортираме по обем (от най-малък към най-голям)
-        volume_sorted = sorted(customers, key=lambda c: c.volume)
-        
-        # Групираме клиентите със същия обем
-        volume_groups = {}
-        for customer in volume_sorted:
-            volume_key = round(customer.volume, 2)  # Закръгляме за по-добро групиране
-            if volume_key not in volume_groups:
-                volume_groups[volume_key] = []
-            volume_groups[volume_key].append(customer)
-        
-        # В рамките на всяка група със същия обем, сортираме по разстояние (от най-далечен към най-близък)
-        result = []
-        for volume_key in sorted(volume_groups.keys()):
-            same_volume_customers = volume_groups[volume_key]
-            # Сортираме по разстояние от депото (от най-далечен към най-близък)
-            distance_sorted = sorted(
-                same_volume_customers,
-                key=lambda c: -calculate_distance_km(c.coordinates, depot_location) if c.coordinates else 0
-            )
-            result.extend(distance_sorted)
+        # Разстоянията до депото се изчисляват наведнъж за всички клиенти (или се взимат от кеша)
+        distances = self._depot_distances(np.ascontiguousarray(coords, dtype=np.float64).tobytes(),
+                                          tuple(depot_location))
         
-        return result
+        # Едно сортиране вместо групиране по обем и отделно сортиране на всяка група:
+        # ключове (по приоритет) - закръглен обем, разстояние (от най-далечен към най-близък),
+        # точен обем; np.lexsort е стабилно, затова при пълно равенство се запазва входният ред
+        volume_keys = np.array([round(v, 2) for v in volumes.tolist()], dtype=np.float64)  # Закръгляме за по-добро групиране
+        return np.lexsort((volumes, -distances, volume_keys))
     
-    def _allocate_with_warehouse(self, customers: List[Customer], 
-                               total_capacity: int) -> WarehouseAllocation:
+    def _allocate_with_warehouse(self, customers: List[Customer], total_capacity: int,
+                               volumes: Optional[np.ndarray] = None,
+                               coords: Optional[np.ndarray] = None) -> WarehouseAllocation:
         """
         Нова логика за разпределение:
         1. Сортиране по обем (от най-малък към най-голям)
@@ -143,6 +199,9 @@ class WarehouseManager:
         3. Пълнене на бусовете до достигане на 100% капацитет или изчерпване на клиентите
         4. Останалите клиенти се оставят в склада
         5. ДОПЪЛНИТЕЛНО: Проверка дали клиентите надвишават капацитета на най-големия бус
+        
+        volumes и coords са масивите от _customer_arrays в реда на customers;
+        ако не са подадени, се изграждат тук.
         """
         logger.info("🔄 Прилагане на нова логика за разпределение на клиенти")
         
@@ -159,50 +218,78 @@ class WarehouseManager:
                 warehouse_customers=customers,
                 total_vehicle_capacity=0,
                 total_vehicle_volume=0,
-                warehouse_volume=sum(c.volume for c in customers),
+                warehouse_volume=_total_volume(customers),
                 capacity_utilization=0
             )
         
         logger.info(f"ℹ️ Капацитет на най-големия бус: {max_single_bus_capacity} ст.")
         
-        vehicle_customers = []
-        warehouse_customers = []
-        current_volume = 0.0
-        
-        # Пълнене на бусовете до достигане на 100% капацитет с проверка за размер на клиентите
-        for customer in customers:
-            # ПРОВЕРКА 1: Дали клиентът е твърде голям за който и да е бус
-            if customer.volume > max_single_bus_capacity:
-                logger.warning(f"⚠️ Клиент '{customer.name}' (обем: {customer.volume:.2f} ст.) е твърде голям "
-                              f"за най-големия бус (капацитет: {max_single_bus_capacity} ст.) и отива директно в склада")
-                warehouse_customers.append(customer)
-                continue
-                
-            # ПРОВЕРКА 2: Дали клиентът е с обем по-голям от максималния за обслужване от бусове
-            max_volume = self.config.max_bus_customer_volume
-            if customer.volume > max_volume:
-                logger.info(f"🔍 Клиент '{customer.name}' (обем: {customer.volume:.2f} ст.) е над максималния обем "
-                           f"за бусове ({max_volume:.2f} ст.) и отива директно в склада")
-                warehouse_customers.append(customer)
-                continue
-            
-            # Стандартна проверка за общ капацитет
-            if current_volume + customer.volume <= total_capacity * self.config.capacity_toleranse:
-                vehicle_customers.append(customer)
-                current_volume += customer.volume
-            else:
-                warehouse_customers.append(customer)
+        # Непроменящите се стойности се изчисляват веднъж
+        max_volume = self.config.max_bus_customer_volume
+        capacity_limit = total_capacity * self.config.capacity_toleranse
+        if volumes is None or coords is None:
+            volumes, coords = self._customer_arrays(customers)
+        
+        # ПРОВЕРКА 1: Клиенти, твърде големи за който и да е бус
+        too_big_for_bus = volumes > max_single_bus_capacity
+        # ПРОВЕРКА 2: Клиенти с обем над максималния за обслужване от бусове
+        over_max_volume = ~too_big_for_bus & (volumes > max_volume)
+        
+        # Твърде големите клиенти се докладват с едно общо предупреждение
+        oversize_names = [customers[i].name for i in np.flatnonzero(too_big_for_bus).tolist()]
+        if oversize_names:
+            shown_names = ", ".join(f"'{name}'" for name in oversize_names[:20])
+            if len(oversize_names) > 20:
+                shown_names += f" и още {len(oversize_names) - 20}"
+            logger.warning("⚠️ %d клиента са твърде големи за най-големия бус (капацитет: %s ст.) "
+                           "и отиват директно в склада: %s",
+                           len(oversize_names), max_single_bus_capacity, shown_names)
+        
+        for i in np.flatnonzero(over_max_volume).tolist():
+            customer = customers[i]
+            logger.info("🔍 Клиент '%s' (обем: %.2f ст.) е над максималния обем "
+                        "за бусове (%.2f ст.) и отива директно в склада",
+                        customer.name, customer.volume, max_volume)
+        
+        # Пълнене на бусовете до достигане на 100% капацитет: докато поредните клиенти се побират,
+        # натрупаният обем е просто кумулативната сума, така че префиксът се намира наведнъж
+        eligible = np.flatnonzero(~(too_big_for_bus | over_max_volume))
+        cumulative = np.cumsum(volumes[eligible])
+        exceeds = cumulative > capacity_limit
+        prefix = int(np.argmax(exceeds)) if exceeds.any() else len(eligible)
+        
+        in_vehicles = np.zeros(len(customers), dtype=bool)
+        in_vehicles[eligible[:prefix]] = True
+        current_volume = float(cumulative[prefix - 1]) if prefix > 0 else 0.0
+        
+        # След първия непобрал се клиент проверяваме останалите поред (по-малък клиент още може да се побере).
+        # Натрупаният обем само расте, така че който не се побира сега, няма да се побере и по-късно
+        tail = eligible[prefix:]
+        if not (volumes[tail] < 0).any():
+            tail = tail[current_volume + volumes[tail] <= capacity_limit]
+        tail_volumes = volumes[tail]
+        # Най-малкият обем сред оставащите кандидати - щом и той не се побира, прекъсваме
+        smallest_remaining = np.minimum.accumulate(tail_volumes[::-1])[::-1].tolist()
+        for i, volume, smallest in zip(tail.tolist(), tail_volumes.tolist(), smallest_remaining):
+            if current_volume + smallest > capacity_limit:
+                break
+            if current_volume + volume <= capacity_limit:
+                in_vehicles[i] = True
+                current_volume += volume
+        
+        vehicle_customers = [customers[i] for i in np.flatnonzero(in_vehicles).tolist()]
+        warehouse_customers = [customers[i] for i in np.flatnonzero(~in_vehicles).tolist()]
         
         # ИДЕНТИФИЦИРАНЕ НА КЛИЕНТИ В ЦЕНТЪР ЗОНАТА
         center_zone_customers = []
         if self.location_config.enable_center_zone_priority:
-            center_zone_customers = self._identify_center_zone_customers(vehicle_customers)
+            center_zone_customers = self._identify_center_zone_customers(vehicle_customers, coords[in_vehicles])
             logger.info(
                 f"🎯 Намерени {len(center_zone_customers)} клиента в център зоната "
                 f"({describe_center_zone(self.location_config)})"
             )
         
-        warehouse_volume = sum(c.volume for c in warehouse_customers)
+        warehouse_volume = _total_volume(warehouse_customers)
         
         logger.info(f"Ново разпределение: {len(vehicle_customers)} за превозни средства, "
                    f"{len(warehouse_customers)} за склад")
@@ -218,136 +305,40 @@ class WarehouseManager:
             center_zone_customers=center_zone_customers
         )
     
-    def _knapsack_allocation(self, customers: List[Customer], capacity: int) -> Optional[Tuple[List[Customer], List[Customer]]]:
-        """Използва knapsack-подобен алгоритъм за оптимално разпределение"""
-        try:
-            n = len(customers)
-            if n == 0:
-                return [], []
-            
-            # Преобразуваме в цели числа за knapsack алгоритъма 
-            volumes = [int(c.volume * 10) for c in customers]  # умножаваме по 10 за точност
-            capacity_int = int(capacity * 10)
-            
-            # Опростен greedy knapsack алгоритъм
-            # Сортираме по ефективност (обем/1 - малко по-голям приоритет за по-големи клиенти)
-            indexed_customers = [(i, customers[i], volumes[i]) for i in range(n)]
-            indexed_customers.sort(key=lambda x: x[2], reverse=True)  # големи първо за по-добро запълване
-            
-            selected = []
-            current_capacity = 0
-            
-            # Greedily добавяме клиенти
-            for idx, customer, volume in indexed_customers:
-                if current_capacity + volume <= capacity_int:  # използваме толеранс за капацитета
-                    selected.append(idx)
-                    current_capacity += volume
-            
-            # Разделяме на vehicle и warehouse клиенти
-            vehicle_customers = [customers[i] for i in selected]
-            warehouse_customers = [customers[i] for i in range(n) if i not in selected]
-            
-            return vehicle_customers, warehouse_customers
-            
-        except Exception as e:
-            logger.error(f"Грешка в knapsack алгоритъм: {e}")
-            return None
-    
-    def _simple_allocation(self, customers: List[Customer], total_capacity: int) -> Tuple[List[Customer], List[Customer]]:
-        """Проста логика за разпределение (fallback)"""
-        vehicle_customers = []
-        warehouse_customers = []
-        current_volume = 0.0
-        
-        for customer in customers:
-            if current_volume + customer.volume <= total_capacity:
-                vehicle_customers.append(customer)
-                current_volume += customer.volume
-            else:
-                warehouse_customers.append(customer)
-        
-        return vehicle_customers, warehouse_customers
-    
-    def _allocate_largest_to_warehouse(self, customers: List[Customer], total_capacity: int) -> Tuple[List[Customer], List[Customer]]:
-        """
-        СТАРА ЛОГИКА - НЕ СЕ ИЗПОЛЗВА ВЕЧЕ
-        Предишната логика, която разпределя клиенти, като отделя големите за склада.
-        Заменена с нова логика за сортиране по обем и разстояние.
-        """
-        logger.info("❌ Тази логика вече не се използва.")
-        return [], []
-        
-        # Старата логика е закоментирана, тъй като вече не се използва
-        """
-        logger.info("✅ Активирано е предварително филтриране на заявки.")
-
-        if not self.vehicle_configs:
-            logger.warning("Няма дефинирани превозни средства. Всички клиенти отиват към solver-а.")
-            return customers, []
-
-        # 1. Намираме капацитета на НАЙ-ГОЛЕМИЯ единичен бус
-        max_vehicle_capacity = 0
-        for v_config in self.vehicle_configs:
-            if v_config.enabled and v_config.capacity > max_vehicle_capacity:
-                max_vehicle_capacity = v_config.capacity
-        
-        if max_vehicle_capacity == 0:
-            logger.warning("Няма налични превозни средства с капацитет > 0.")
-            return customers, []
-            
-        logger.info(f"ДЕБЪГ: Максимален капацитет на единичен бус: {max_vehicle_capacity}")
-
-        # 2. Определяме прага за "голяма" заявка
-        large_request_threshold_volume = max_vehicle_capacity * self.config.large_request_threshold
-        logger.info(f"ДЕБЪГ: Праг за 'голяма' заявка (над {self.config.large_request_threshold:.0%}): {large_request_threshold_volume:.2f} ст.")
-
-        vehicle_customers = []
-        warehouse_customers = []
-
-        for customer in customers:
-            # 3. Проверяваме дали клиентът е АБСОЛЮТНО невъзможен
-            if customer.volume > max_vehicle_capacity:
-                logger.warning(f"ДЕБЪГ: Клиент '{customer.name}' (обем: {customer.volume}) е твърде голям "
-                               f"(надвишава {max_vehicle_capacity}) и се изпраща директно в склада.")
-                warehouse_customers.append(customer)
-                continue
-
-            # 4. Проверяваме дали да го преместим в склада според конфигурацията
-            if self.config.move_largest_to_warehouse and customer.volume > large_request_threshold_volume:
-                logger.info(f"ДЕБЪГ: Клиент '{customer.name}' (обем: {customer.volume}) се счита за 'голям' и се изпраща в склада.")
-                warehouse_customers.append(customer)
+    def _identify_center_zone_customers(self, customers: List[Customer],
+                                        coords: Optional[np.ndarray] = None) -> List[Customer]:
+        """Идентифицира клиентите, които са в център зоната"""
+        if not customers:
+            return []
+        if coords is None:
+            coords = self._customer_arrays(customers)[1]
+        
+        center_location = self.location_config.center_location
+        mode = getattr(self.location_config, "center_zone_mode", "circle")
+        polygon = getattr(self.location_config, "center_zone_polygon", [])
+        
+        if str(mode).lower() == "polygon" and len(polygon) >= 3:
+            # Полигонът се проверява поотделно за всеки клиент
+            in_zone = [bool(c.coordinates) and is_location_in_center_zone(c.coordinates, self.location_config)
+                       for c in customers]
+        else:
+            # Кръгла зона - една векторизирана проверка за всички клиенти. Вместо разстоянието
+            # сравняваме директно члена a с прага sin²(r/2R) - без sqrt и arcsin (NaN никога не е <= прага)
+            radius_km = self.location_config.center_zone_radius_km
+            if radius_km < 0:
+                in_zone = np.zeros(len(customers), dtype=bool)
             else:
-                vehicle_customers.append(customer)
-
-        # Финални изчисления
-        vehicle_volume = sum(c.volume for c in vehicle_customers)
-        warehouse_volume = sum(c.volume for c in warehouse_customers)
-        actual_utilization = vehicle_volume / total_capacity if total_capacity > 0 else 0
-        
-        # Логиране на резултата
-        logger.info(f"Предварително разпределение завършено:")
-        logger.info(f"  🚛 Клиенти за Solver: {len(vehicle_customers)} ({vehicle_volume:.1f} ст.)")
-        logger.info(f"  🏭 Клиенти за Склад (твърде големи): {len(warehouse_customers)} ({warehouse_volume:.1f} ст.)")
-        logger.info(f"  📊 Потенциално използване на капацитет: {actual_utilization:.1%}")
-
-        # Проверка за валидност
-        total_input_volume = sum(c.volume for c in customers)
-        total_output_volume = vehicle_volume + warehouse_volume
-        if abs(total_input_volume - total_output_volume) > 0.1:
-            logger.error(f"❌ Грешка в разпределението: Input {total_input_volume:.1f} != Output {total_output_volume:.1f}")
+                a_threshold = math.sin(min(radius_km / 6371, math.pi) / 2) ** 2
+                in_zone = self._haversine_terms(coords, center_location) <= a_threshold
         
-        return vehicle_customers, warehouse_customers
-        """
-    
-    def _identify_center_zone_customers(self, customers: List[Customer]) -> List[Customer]:
-        """Идентифицира клиентите, които са в център зоната"""
-        center_zone_customers = []
+        zone_indices = np.flatnonzero(in_zone)
+        center_zone_customers = [customers[i] for i in zone_indices.tolist()]
         
-        for customer in customers:
-            if customer.coordinates and is_location_in_center_zone(customer.coordinates, self.location_config):
-                center_zone_customers.append(customer)
-                logger.debug(f"🎯 Клиент '{customer.name}' е в център зоната (разстояние: "
-                           f"{calculate_distance_km(customer.coordinates, self.location_config.center_location):.2f} км)")
+        # Истинските разстояния са нужни само за дебъг лога - изчисляват се само ако той е включен
+        if logger.isEnabledFor(logging.DEBUG):
+            distances = self._compute_distances(coords[zone_indices], center_location)
+            for customer, distance in zip(center_zone_customers, distances.tolist()):
+                logger.debug("🎯 Клиент '%s' е в център зоната (разстояние: %.2f км)", customer.name, distance)
         
         return center_zone_customers
     
@@ -383,16 +374,19 @@ class WarehouseManager:
             return False
         
         # Проверка за дублирани клиенти
-        all_customer_ids = [c.id for c in allocation.vehicle_customers] + [c.id for c in allocation.warehouse_customers]
-        if len(all_customer_ids) != len(set(all_customer_ids)):
-            logger.error("Открити дублирани клиенти в разпределението")
-            return False
+        seen_ids = set()
+        seen_add = seen_ids.add
+        for customer in chain(allocation.vehicle_customers, allocation.warehouse_customers):
+            if customer.id in seen_ids:
+                logger.error("Открити дублирани клиенти в разпределението")
+                return False
+            seen_add(customer.id)
         
         return True
     
     def can_fit_in_vehicles(self, customers: List[Customer]) -> bool:
         """Проверява дали клиентите могат да се поберат в превозните средства"""
-        total_volume = sum(c.volume for c in customers)
+        total_volume = _total_volume(customers)
         total_capacity = self._calculate_total_vehicle_capacity()
         
         return total_volume <= total_capacity
@@ -402,17 +396,15 @@ class WarehouseManager:
 def allocate_customers_to_vehicles_and_warehouse(input_data: InputData) -> WarehouseAllocation:
     """Удобна функция за разпределение на клиенти"""
     manager = WarehouseManager()
+    # optimize_allocation не променя разпределението (логиката е в solver-а), затова не се извиква
     allocation = manager.allocate_customers(input_data)
     
-    # Оптимизация на разпределението
-    optimized_allocation = manager.optimize_allocation(allocation)
-    
     # Валидация
-    if not manager.validate_allocation(optimized_allocation):
+    if not manager.validate_allocation(allocation):
         raise ValueError("Невалидно разпределение на клиенти")
     
     # Логиране на резюмето
-    summary = manager.get_allocation_summary(optimized_allocation)
+    summary = manager.get_allocation_summary(allocation)
     logger.info(f"Резюме на разпределението: {summary}")
     
-    return optimized_allocation 
+    return allocation 